@@ -1,8 +1,11 @@
 import streamlit as st
+import codecs
+import os
 import random
 import time
 import json
-from pathlib import Path
+import urllib.request
+import uuid
 from difflib import get_close_matches
 
 # --- Simple Sentiment Analysis ---
@@ -50,21 +53,78 @@ class Personality:
             "One moment please..."
         ])
 
+# --- Chat Engine ---
+@st.cache_resource
+def load_engine():
+    """One ChatEngine per Streamlit process, shared by every browser session"""
+    from core.chat_engine import ChatEngine
+    from utils.config import config
+    return ChatEngine(config)
+
+@st.cache_resource
+def load_chat_log():
+    """Conversation logger, if ``log_conversations`` is set; one per process"""
+    from utils.config import config
+    from utils.logger import ChatLogger
+    return ChatLogger() if config["log_conversations"] else None
+
+# --- Response Generation ---
+def respond(prompt, engine, personality, session_id=None):
+    """Yield the reply in chunks as the engine produces them: filler, answer, follow-up"""
+    # Add filler (50% chance)
+    if random.random() < 0.5:
+        yield personality.get_filler() + " "
+    
+    # Add sentiment around the streamed answer (LLM tokens arrive one by one)
+    sentiment = analyze_sentiment(prompt)
+    if sentiment == "negative":
+        yield "I understand your concern. "
+    yield from engine.stream_query(prompt, session_id)
+    if sentiment == "positive":
+        yield random.choice([" 😊", "!"])
+    
+    # Add follow-up (30% chance)
+    if random.random() < 0.3:
+        yield "\n\nIs there anything else you'd like to know?"
+
+def stream_from_server(prompt, server_url, session_id=None):
+    """Thin-client mode: stream the reply from a running `server.py`"""
+    request = urllib.request.Request(
+        f"{server_url.rstrip('/')}/chat/stream",
+        data=json.dumps({"message": prompt, "session_id": session_id}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            for data in iter(lambda: response.read1(4096), b""):
+                yield decoder.decode(data)
+    except OSError as e:
+        print(f"Chat server request failed: {e}")
+        yield "Sorry, I can't reach the assistant right now. Please try again shortly."
+
+def render_stream(chunks, placeholder):
+    """Show each chunk as soon as it arrives, with a cursor until the stream ends"""
+    display_text = ""
+    placeholder.markdown("...")
+    for chunk in chunks:
+        display_text += chunk
+        placeholder.markdown(display_text + "▌")
+    placeholder.markdown(display_text)
+    return display_text
+
 # --- Main Application ---
 def main():
     # Initialize components
     personality = Personality()
     
-    # Load QA data
-    try:
-        qa_path = Path(__file__).parent / "data" / "qa_dataset.json"
-        with open(qa_path) as f:
-            qa_data = json.load(f)
-    except:
-        qa_data = [
-            {"question": "admission requirements", "answer": "5 credits including Math and English"},
-            {"question": "school fees", "answer": "₦500,000 - ₦800,000 per session"}
-        ]
+    # With CHAT_SERVER_URL set, answers come from server.py and nothing is loaded here
+    server_url = os.environ.get("CHAT_SERVER_URL")
+    if not server_url:
+        # Build the engine once per process, not per rerun
+        engine = load_engine()
+    # server.py logs its own exchanges
+    chat_log = None if server_url else load_chat_log()
     
     # Streamlit UI
     st.title("🎓 Crescent University Assistant")
@@ -72,6 +132,7 @@ def main():
     # Initialize chat
     if "messages" not in st.session_state:
         st.session_state.messages = [{"role": "assistant", "content": personality.get_greeting()}]
+        st.session_state.session_id = uuid.uuid4().hex
     
     # Display messages
     for msg in st.session_state.messages:
@@ -84,50 +145,20 @@ def main():
         st.session_state.messages.append({"role": "user", "content": prompt})
         
         # Generate response
+        start = time.perf_counter()
         with st.chat_message("assistant"):
-            # Typing indicator
-            with st.empty():
-                st.markdown("...")
-                time.sleep(0.5)
-            
-            # Get response
-            response = ""
-            
-            # Add filler (50% chance)
-            if random.random() < 0.5:
-                response += personality.get_filler() + " "
-            
-            # Find best answer
-            query = prompt.lower()
-            answer = next(
-                (qa["answer"] for qa in qa_data if qa["question"] in query),
-                "I'll need to check that for you. Please email info@crescent.edu.ng"
-            )
-            
-            # Add sentiment
-            sentiment = analyze_sentiment(prompt)
-            if sentiment == "positive":
-                answer += random.choice([" 😊", "!"])
-            elif sentiment == "negative":
-                answer = "I understand your concern. " + answer
-            
-            response += answer
-            
-            # Add follow-up (30% chance)
-            if random.random() < 0.3:
-                response += "\n\nIs there anything else you'd like to know?"
-            
-            # Display with typing effect
-            display_text = ""
-            placeholder = st.empty()
-            for char in response:
-                display_text += char
-                placeholder.markdown(display_text + "▌")
-                time.sleep(0.05)
-            placeholder.markdown(display_text)
+            # Render chunks as they are produced; no artificial typing delay
+            if server_url:
+                chunks = stream_from_server(prompt, server_url, st.session_state.session_id)
+            else:
+                chunks = respond(prompt, engine, personality, st.session_state.session_id)
+            response = render_stream(chunks, st.empty())
         
         # Save response
         st.session_state.messages.append({"role": "assistant", "content": response})
+        if chat_log is not None:
+            chat_log.log_conversation(prompt, response, time.perf_counter() - start,
+                                     st.session_state.session_id)
 
 if __name__ == "__main__":
     main()
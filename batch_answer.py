@@ -0,0 +1,188 @@
+"""Answer a file of questions offline with ``ChatEngine``.
+
+    python batch_answer.py questions.jsonl answers.jsonl --batch-size 64 --workers 4
+    python batch_answer.py backlog.csv answers.jsonl --question-field body --id-field email_id
+
+Input is JSONL (one object per line) or CSV (header row), read lazily.
+Each record needs a question field. It may also have an id (default: the
+record's line number) and a ``session_id`` to thread follow-up questions
+into one conversation; otherwise every question is answered on its own.
+
+Questions go through ``ChatEngine.answer_queries`` in batches. Each batch
+gets one embedding pass and one index search. With ``--workers`` > 1 the
+engine is built once and forked into worker processes, like ``server.py``,
+so the CPU-bound stages run in parallel over shared memory. Conversation
+memory lives in each worker, so every question of a session goes to the
+same worker, in file order, and never shares a batch with the turn before
+it. Each answer is
+appended to the output JSONL as
+``{"id", "question", "answer", "stage", "confidence"}`` as soon as its
+batch finishes. Rerunning the same command skips ids already in the output,
+so an interrupted run resumes where it stopped.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+from collections import deque
+from multiprocessing.util import Finalize
+from pathlib import Path
+from typing import Dict, Iterator, List, Set, Tuple
+
+from server import load_config
+
+_engine = None  # set before forking, shared copy-on-write with the pool
+
+
+def read_questions(path: Path, question_field: str = "question",
+                   id_field: str = "id") -> Iterator[Dict]:
+    """Records of a JSONL or CSV file as {"id", "question", "session_id"}"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix.lower() == ".csv":
+            rows = enumerate(csv.DictReader(f), start=2)  # line 1 is the header
+        else:
+            rows = ((n, json.loads(line)) for n, line in enumerate(f, start=1) if line.strip())
+        for line, record in rows:
+            question = record.get(question_field)
+            if not isinstance(question, str) or not question.strip():
+                print(f"{path}:{line}: no '{question_field}', skipped", file=sys.stderr)
+                continue
+            record_id = record.get(id_field)
+            yield {"id": str(line if record_id is None else record_id), "question": question,
+                   "session_id": record.get("session_id") or None}
+
+
+def answered_ids(path: Path) -> Set[str]:
+    """Ids already in an output file; a line cut off by an interruption is removed"""
+    if not path.exists():
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            f.truncate(complete)
+    return {json.loads(line)["id"] for line in data[:complete].splitlines() if line.strip()}
+
+
+def route(records: Iterator[Dict], size: int, workers: int) -> Iterator[Tuple[int, List[Dict]]]:
+    """Batches of at most ``size`` records, each with the worker that must answer it.
+
+    A session always maps to the same worker, and a batch is cut before a
+    second turn of a session it already holds, so each follow-up is answered
+    after the turns before it. Records without a session fill one worker's
+    batch at a time.
+    """
+    buffers: List[List[Dict]] = [[] for _ in range(workers)]
+    sessions: List[Set[str]] = [set() for _ in range(workers)]
+    current = 0
+    for record in records:
+        session_id = record["session_id"]
+        worker = zlib.crc32(session_id.encode("utf-8")) % workers if session_id else current
+        if session_id in sessions[worker]:
+            yield worker, buffers[worker]
+            buffers[worker], sessions[worker] = [], set()
+        buffers[worker].append(record)
+        if session_id:
+            sessions[worker].add(session_id)
+        if len(buffers[worker]) >= size:
+            yield worker, buffers[worker]
+            buffers[worker], sessions[worker] = [], set()
+            if worker == current:
+                current = (current + 1) % workers
+    for worker, batch in enumerate(buffers):
+        if batch:
+            yield worker, batch
+
+
+def run_routed(pools, routed: Iterator[Tuple[int, List[Dict]]]) -> Iterator[List[Dict]]:
+    """Answer each batch in its worker's single-process pool; results come back in submission order"""
+    pending = deque()
+    for worker, batch in routed:
+        pending.append(pools[worker].apply_async(answer_batch, (batch,)))
+        # A pool runs its batches one at a time, in order; keep a few queued per worker
+        while pending and (pending[0].ready() or len(pending) > 2 * len(pools)):
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def answer_batch(batch: List[Dict]) -> List[Dict]:
+    # Questions without a session get a throwaway one, so context never leaks between them
+    session_ids = [r["session_id"] or f"batch:{r['id']}" for r in batch]
+    answers = _engine.answer_queries([r["question"] for r in batch], session_ids)
+    for record, session_id in zip(batch, session_ids):
+        if not record["session_id"]:
+            _engine.memory.end_session(session_id)
+    return [{"id": r["id"], "question": r["question"], "answer": a.text,
+             "stage": a.stage, "confidence": round(float(a.confidence), 4)}
+            for r, a in zip(batch, answers)]
+
+
+def _init_worker():
+    _engine.after_fork()
+    Finalize(None, _engine.close, exitpriority=10)  # flush caches when the pool shuts down
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of questions with ChatEngine")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("output", type=Path, help="JSONL file; appended to and resumed from")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--config", type=Path, help="JSON file of engine settings")
+    args = parser.parse_args()
+
+    global _engine
+    from core.chat_engine import ChatEngine
+
+    done = answered_ids(args.output)
+    if done:
+        print(f"Resuming: {len(done)} questions already answered in {args.output}", file=sys.stderr)
+    records = (r for r in read_questions(args.input, args.question_field, args.id_field) if r["id"] not in done)
+
+    start = time.perf_counter()
+    _engine = ChatEngine(load_config(args.config))
+    _engine.normalizer.wait_until_ready()
+    print(f"Engine ready in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    workers = max(1, args.workers) if hasattr(os, "fork") else 1
+    routed = route(records, args.batch_size, workers)
+    # One single-process pool per worker, so batches can be sent to a specific process
+    pools = [multiprocessing.get_context("fork").Pool(1, _init_worker) for _ in range(workers)] \
+        if workers > 1 else []
+    results = run_routed(pools, routed) if pools else (answer_batch(batch) for _, batch in routed)
+
+    count, start = 0, time.perf_counter()
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            for n, answers in enumerate(results, start=1):
+                out.writelines(json.dumps(a, ensure_ascii=False) + "\n" for a in answers)
+                out.flush()
+                count += len(answers)
+                if n % 10 == 0:
+                    print(f"{count} answered, {count / (time.perf_counter() - start):.1f}/s", file=sys.stderr)
+        for pool in pools:
+            pool.close()
+        for pool in pools:
+            pool.join()
+    except KeyboardInterrupt:
+        for pool in pools:
+            pool.terminate()
+        print(f"\nInterrupted after {count} answers; rerun the same command to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        _engine.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Answered {count} questions in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
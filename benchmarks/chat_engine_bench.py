@@ -0,0 +1,79 @@
+"""Answer paths: ``process_query`` vs ``stream_query`` on the same questions.
+
+The questions mix knowledge-base hits, questions only a fallback tier can
+answer and rude messages. Each one is asked on both paths, in a fresh
+session each time, and the two answers must be the same text. Queries are
+embedded by the retrieval bench's hashed stub, the OpenAI LLM is off and
+the local LLM and transformer safety tiers are stubbed, so no model is
+downloaded:
+
+    python -m benchmarks.chat_engine_bench
+
+Exits non-zero if any question is answered differently on the two paths.
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import core.chat_engine
+from benchmarks.retrieval_bench import StubEmbedder
+from benchmarks.safety_bench import stub_classifier
+from utils.config import config
+
+FALLBACK_QUESTIONS = [
+    "what jamb score do i need for quantum basket weaving",  # category tier
+    "how much is the school fee for astrology",
+    "is there a hostel for visiting penguins",
+    "purple elephants dancing",
+    "zzqx blorp frobnicate",
+]
+RUDE = ["this portal is useless, shut up", "you stupid idiot"]
+
+
+def make_engine(data_dir: Path):
+    core.chat_engine.EmbeddingModel = lambda settings: StubEmbedder()
+    engine = core.chat_engine.ChatEngine(config.replace(
+        data_dir=data_dir, use_openai=False, spell_check=False,
+        preload_models=False, hot_reload=False, response_cache_path=None,
+    ))
+    engine.fallback._llm_failed = True  # skip the Phi-3 download; the default tier answers instead
+    engine.safety._batcher.classify = stub_classifier(0.0)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kb-questions", type=int, default=20,
+                        help="dataset questions to ask alongside the fallback ones")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        shutil.copytree(config["data_dir"], data_dir, ignore=shutil.ignore_patterns("index"))
+        engine = make_engine(data_dir)
+        questions = engine.qa_data.questions[:args.kb_questions] + FALLBACK_QUESTIONS + RUDE
+
+        mismatches, batch_s, stream_s = [], 0.0, 0.0
+        print(f"{'stage':<18} question")
+        for n, question in enumerate(questions):
+            start = time.perf_counter()
+            answer = engine.answer_queries([question], [f"batch-{n}"])[0]
+            batch_s += time.perf_counter() - start
+            start = time.perf_counter()
+            streamed = "".join(engine.stream_query(question, f"stream-{n}")).strip()
+            stream_s += time.perf_counter() - start
+            print(f"{answer.stage:<18} {question[:60]}")
+            if answer.text != streamed:
+                mismatches.append(f"{question!r}: process_query {answer.text[:60]!r} "
+                                  f"({answer.stage}), stream_query {streamed[:60]!r}")
+        print(f"\n{len(questions)} questions, mean ms: process_query {batch_s / len(questions) * 1000:.2f}"
+              f"  stream_query {stream_s / len(questions) * 1000:.2f}")
+    if mismatches:
+        sys.exit("Answer paths disagree:\n  " + "\n  ".join(mismatches))
+
+
+if __name__ == "__main__":
+    main()
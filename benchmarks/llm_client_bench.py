@@ -0,0 +1,170 @@
+"""LLMClient against a local OpenAI-compatible stub server.
+
+The stub streams a fixed answer over SSE with a configurable delay per
+chunk and records how many requests reached it and how many ran at once.
+Four scenarios:
+
+    burst     many callers ask the same question at once (coalescing)
+    distinct  many different questions (concurrency cap)
+    outage    the upstream stalls past the deadline (timeouts, breaker)
+    shed      more questions while the breaker is open (fail fast)
+
+    python -m benchmarks.llm_client_bench --callers 64 --max-concurrency 8
+
+Exits non-zero if a guarantee is broken: a burst must reach upstream once,
+distinct questions may not run more than ``--max-concurrency`` at once, and the
+breaker must be open after the outage, with no shed call reaching upstream.
+
+Needs the ``openai`` package; no API key or network access.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from core.llm_client import LLMClient, LLMUnavailable
+from utils.config import Settings
+from utils.metrics import metrics
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            server.connections.add(self.client_address)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = f"Stub answer to: {body['messages'][-1]['content']}".split()
+            for word in words:
+                time.sleep(server.delay)
+                event = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self._write(f"data: {json.dumps(event)}\n\n")
+            self._write("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client gave up at its deadline
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _write(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, delay: float):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = self.active = self.peak = 0
+        self.connections = set()
+
+
+def ask(client: LLMClient, question: str):
+    start = time.perf_counter()
+    try:
+        client.complete([{"role": "user", "content": question}])
+        ok = True
+    except LLMUnavailable:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run(client: LLMClient, questions, callers: int):
+    with ThreadPoolExecutor(callers) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda q: ask(client, q), questions))
+        elapsed = time.perf_counter() - start
+    latencies = np.array([latency for _, latency in results]) * 1000
+    return sum(ok for ok, _ in results), elapsed, latencies
+
+
+def report(name: str, server: StubServer, questions, results):
+    ok, elapsed, latencies = results
+    print(f"{name:<9} {len(questions):>6} {ok:>5} {server.requests:>9} {server.peak:>6} "
+          f"{len(server.connections):>6} {np.percentile(latencies, 50):9.1f} "
+          f"{np.percentile(latencies, 99):9.1f} {elapsed:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--callers", type=int, default=64)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.01, help="stub seconds per streamed word")
+    parser.add_argument("--timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = StubServer(args.delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = Settings(llm_base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", openai_model="stub",
+                      llm_timeout=args.timeout, llm_slow_call=args.timeout,
+                      llm_max_concurrency=args.max_concurrency, llm_breaker_failures=3,
+                      llm_breaker_cooldown=60.0)
+
+    print(f"{'scenario':<9} {'calls':>6} {'ok':>5} {'upstream':>9} {'peak':>6} {'conns':>6} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'wall s':>8}")
+    client = LLMClient(config)
+    client.client  # import openai and build the pool outside the timings
+    failures = []
+    burst = ["what are the admission requirements?"] * args.callers
+    report("burst", server, burst, run(client, burst, args.callers))
+    if server.requests != 1:
+        failures.append(f"burst: {server.requests} upstream requests for one question, expected 1")
+
+    server.reset()
+    distinct = [f"question number {i}" for i in range(args.callers)]
+    report("distinct", server, distinct, run(client, distinct, args.callers))
+    if server.peak > args.max_concurrency:
+        failures.append(f"distinct: {server.peak} calls ran at once, cap is {args.max_concurrency}")
+
+    server.reset()
+    server.delay = args.timeout  # every answer now takes several deadlines
+    client = LLMClient(config)
+    client.client
+    outage = [f"question during outage {i}" for i in range(args.callers)]
+    report("outage", server, outage, run(client, outage, args.callers))
+    # No cap check here: a stub handler keeps sleeping after the client times out
+    # and frees its slot, so the stub's peak also counts abandoned calls
+    if client.breaker.state != "open":
+        failures.append(f"outage: breaker is {client.breaker.state} after the outage, expected open")
+    server.reset()
+    shed = run(client, outage, args.callers)
+    report("shed", server, outage, shed)
+    if server.requests or shed[0]:
+        failures.append(f"shed: {server.requests} upstream requests and {shed[0]} answers "
+                        "while the breaker was open, expected none")
+    counts = metrics.to_dict()["counters"].get("llm_requests_total", {})
+    print("\nresults: " + ", ".join(f"{k.split('=')[1]} {int(v)}" for k, v in sorted(counts.items())))
+    print(f"breaker after outage: {client.breaker.state}")
+    server.shutdown()
+    if failures:
+        sys.exit("LLM client checks failed:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Parity and throughput of the ONNX embedding backend against torch.
+
+Embeds the knowledge-base questions with the torch SentenceTransformer and
+with the exported ONNX graphs (fp32 and int8), then reports cosine parity,
+whether nearest-neighbour answers change, and latency/throughput:
+
+    python -m models.onnx_backend --model all-MiniLM-L6-v2
+    python -m benchmarks.onnx_bench --threads 4
+
+Exits non-zero if a backend is out of tolerance (``parity_failures``: the
+fp32 graph within ``--atol`` of torch per component, every graph at least
+``--min-cosine``), so it can gate a deployment.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from models.onnx_backend import (FP32_ATOL, FP32_FILE, INT8_FILE, INT8_MIN_COSINE, OnnxEncoder, model_dir,
+                                 parity_failures)
+
+ROOT = Path(__file__).parent.parent
+
+
+def timed_encode(encoder, texts, batch_size: int, repeats: int):
+    """Best-of-``repeats`` wall time for encoding ``texts`` in batches"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            encoder.encode(texts[i:i + batch_size], convert_to_numpy=True, normalize_embeddings=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--data-dir", type=Path, default=ROOT / "data")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads (0 = all cores)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=INT8_MIN_COSINE)
+    parser.add_argument("--atol", type=float, default=FP32_ATOL, help="fp32 per-component tolerance")
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    with open(args.data_dir / "qa_dataset.json") as f:
+        questions = [qa["question"] for qa in json.load(f)]
+    # Paraphrase-like queries: questions with their words shuffled
+    rng = np.random.default_rng(0)
+    queries = [" ".join(rng.permutation(q.split())) for q in questions]
+
+    export_dir = model_dir(args.data_dir, args.model)
+    encoders = {"torch": SentenceTransformer(args.model, device="cpu")}
+    for name, filename, quantized in (("onnx-fp32", FP32_FILE, False), ("onnx-int8", INT8_FILE, True)):
+        if (export_dir / filename).exists():
+            encoders[name] = OnnxEncoder(export_dir, quantized=quantized, intra_op_threads=args.threads)
+    if len(encoders) == 1:
+        sys.exit(f"No ONNX export in {export_dir}; run `python -m models.onnx_backend --model {args.model}`")
+
+    reference = encoders["torch"].encode(questions, normalize_embeddings=True)
+    reference_top1 = (encoders["torch"].encode(queries, normalize_embeddings=True) @ reference.T).argmax(axis=1)
+
+    print(f"{len(questions)} questions, torch threads {torch.get_num_threads()}, onnx threads {args.threads or 'all'}")
+    print(f"{'backend':<10} {'min cos':>8} {'mean cos':>9} {'top-1 agree':>12} "
+          f"{'1-query ms':>11} {'batch-32 /s':>12}")
+    failures = []
+    for name, encoder in encoders.items():
+        embeds = encoder.encode(questions, normalize_embeddings=True)
+        cosines = (embeds * reference).sum(axis=1)
+        top1 = (encoder.encode(queries, normalize_embeddings=True) @ embeds.T).argmax(axis=1)
+        agree = float((top1 == reference_top1).mean())
+
+        single = timed_encode(encoder, questions[:50], 1, args.repeats) / min(50, len(questions))
+        batched = len(questions) / timed_encode(encoder, questions, 32, args.repeats)
+        print(f"{name:<10} {cosines.min():8.4f} {cosines.mean():9.4f} {agree:12.1%} "
+              f"{single * 1000:11.2f} {batched:12.1f}")
+        if name != "torch":
+            failures += parity_failures(name, reference, embeds, name == "onnx-int8",
+                                        atol=args.atol, min_cosine=args.min_cosine)
+
+    if failures:
+        sys.exit("Parity check failed:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""Retrieval quality and speed over query variants of the QA dataset.
+
+Each sampled question is turned into variants a student might actually
+type: the question verbatim, with typos, with words abbreviated (the
+reverse of ``abbreviations.csv``), with synonyms swapped in (the reverse of
+``synonyms.csv``) and as a bare keyword query. Every variant goes through
+the same normalizer as ``ChatEngine`` and then through each stage:
+
+    bm25      LexicalIndex.search
+    dense     vector index over the question embeddings
+    pipeline  RetrievalPipeline.retrieve (exact -> BM25 -> re-rank -> dense)
+    batch     RetrievalPipeline.retrieve_batch, 32 queries per call
+
+A hit is a row with the target's answer (the dataset has duplicate
+questions). The report has top-1/top-k accuracy per variant, how many
+pipeline answers clear each similarity threshold and how many of those are
+right (the data behind ``similarity_threshold``), latency percentiles,
+throughput and peak traced memory.
+
+By default queries are embedded by a hashed bag-of-words stub, so no model
+is downloaded and numbers are reproducible; ``--embedder model`` uses the
+configured sentence-transformer and its on-disk index instead:
+
+    python -m benchmarks.retrieval_bench
+    python -m benchmarks.retrieval_bench --save-baseline
+    python -m benchmarks.retrieval_bench --embedder model
+
+If a baseline for the embedder exists, results are compared against it and
+the exit status is 1 on a regression. Saved baselines hold only the
+deterministic accuracy numbers, so the committed ones hold on any machine.
+Latency and memory depend on the machine; ``--timings`` saves them too, for
+a local baseline, and they are compared whenever a baseline has them:
+
+    python -m benchmarks.retrieval_bench --save-baseline --timings --baseline /tmp/local.json
+    python -m benchmarks.retrieval_bench --baseline /tmp/local.json
+"""
+import argparse
+import json
+import random
+import re
+import string
+import sys
+import time
+import tracemalloc
+import zlib
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from core.embedding_index import EmbeddingIndex
+from core.knowledge_base import KnowledgeBase
+from core.lexical_index import LexicalIndex
+from core.preprocessing import TextNormalizer
+from core.retrieval import RetrievalPipeline
+from core.vector_index import build_vector_index
+from utils.config import Settings
+
+ROOT = Path(__file__).parent.parent
+BASELINE_DIR = Path(__file__).parent / "baselines"
+VARIANTS = ("exact", "typo", "abbrev", "synonym", "keywords")
+STAGES = ("bm25", "dense", "pipeline")
+THRESHOLDS = (0.4, 0.5, 0.6, 0.7, 0.8)
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_FILLER = {"a", "an", "the", "is", "are", "of", "in", "for", "to", "do", "does", "what", "how", "which"}
+_KEYBOARD = "qwertyuiopasdfghjklzxcvbnm"
+
+
+class StubEmbedder:
+    """Deterministic hashed bag of words and character trigrams, unit-normalized.
+
+    Shares enough of a real encoder's behaviour (overlapping words and
+    misspellings land close together) to exercise the dense stages.
+    """
+
+    model_name = "stub-hash"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower())
+        grams = [w[i:i + 3] for w in (f"#{w}#" for w in words) for i in range(len(w) - 2)]
+        return words + words + grams  # whole words count double
+
+    def encode(self, texts, normalize: bool = True) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                out[row, zlib.crc32(feature.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-9) if normalize else out
+
+
+# --- Query variants ---
+
+def _phrase_pattern(phrases) -> re.Pattern:
+    alternation = "|".join(map(re.escape, sorted(phrases, key=len, reverse=True)))
+    return re.compile(rf"(?<![\w-])(?:{alternation})(?![\w-])")
+
+
+def _reverse_table(table: Dict[str, str]) -> Dict[str, List[str]]:
+    """Full form -> the short/colloquial forms that normalize to it"""
+    reverse: Dict[str, List[str]] = {}
+    for short, full in table.items():
+        if short != full and len(full) > 1:
+            reverse.setdefault(full, []).append(short)
+    return reverse
+
+
+def _substitute(text: str, reverse: Dict[str, List[str]], rng: random.Random) -> str:
+    if not reverse:
+        return text
+    return _phrase_pattern(reverse).sub(lambda m: rng.choice(reverse[m.group(0)]), text)
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word) - 1)
+    op = rng.randrange(4)
+    if op == 0:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]  # swap
+    if op == 1:
+        return word[:i] + word[i + 1:]  # drop
+    if op == 2:
+        return word[:i] + word[i] + word[i:]  # double
+    return word[:i] + rng.choice(_KEYBOARD) + word[i + 1:]  # wrong key
+
+
+def make_variants(questions: List[str], abbreviations: Dict[str, str], synonyms: Dict[str, str],
+                  seed: int = 0) -> Dict[str, List[Tuple[int, str]]]:
+    """``{variant: [(question index, query), ...]}``; a variant is skipped when it equals the original"""
+    rng = random.Random(seed)
+    reverse_abbrev, reverse_synonyms = _reverse_table(abbreviations), _reverse_table(synonyms)
+    variants: Dict[str, List[Tuple[int, str]]] = {name: [] for name in VARIANTS}
+    for i, question in enumerate(questions):
+        lowered = question.lower().rstrip("?. ")
+        words = lowered.split()
+
+        typo_words = list(words)
+        long_words = [j for j, w in enumerate(words) if len(w) >= 4 and w.isalpha()]
+        for j in rng.sample(long_words, min(len(long_words), rng.randint(1, 2))):
+            typo_words[j] = _typo(typo_words[j], rng)
+        keywords = [w.strip(string.punctuation) for w in words if w not in _FILLER]
+        prefix = rng.choice(["", "tell me ", "i want to know ", "info on "])
+
+        candidates = {
+            "exact": question,
+            "typo": " ".join(typo_words),
+            "abbrev": _substitute(lowered, reverse_abbrev, rng),
+            "synonym": _substitute(lowered, reverse_synonyms, rng),
+            "keywords": prefix + " ".join(w for w in keywords if w),
+        }
+        for name, query in candidates.items():
+            if name == "exact" or query != lowered:
+                variants[name].append((i, query))
+    return variants
+
+
+# --- Measurement ---
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    ms = np.asarray(latencies) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "qps": float(len(ms) / max(ms.sum() / 1000, 1e-9))}
+
+
+def run_stage(name: str, retriever: RetrievalPipeline, embed: Callable, queries: List[str], k: int):
+    """Ranked rows (best first) and wall time per query for one stage"""
+    ranked, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        if name == "bm25":
+            rows = [row for row, _ in retriever.lexical.search(query, k=k)]
+        elif name == "dense":
+            rows = list(retriever.vector_index.search(embed(query)[0], k=k)[0])
+        else:
+            result = retriever.retrieve(query, lambda text: embed(text)[0])
+            rows = [result] if result else []
+        latencies.append(time.perf_counter() - start)
+        ranked.append(rows)
+    return ranked, latencies
+
+
+def run_batched(retriever: RetrievalPipeline, embed: Callable, queries: List[str], batch_size: int):
+    latencies = []
+    for i in range(0, len(queries), batch_size):
+        batch = queries[i:i + batch_size]
+        start = time.perf_counter()
+        retriever.retrieve_batch(batch, embed)
+        latencies.extend([(time.perf_counter() - start) / len(batch)] * len(batch))
+    return latencies
+
+
+def evaluate(args) -> Dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    data_dir = args.data_dir
+    kb = KnowledgeBase.from_json(data_dir / "qa_dataset.json")
+    config = Settings(data_dir=data_dir, embedding_model=args.model, spell_check=args.spell_check,
+                      spell_check_background=False, similarity_threshold=args.similarity_threshold)
+    normalizer = TextNormalizer(config)
+
+    if args.embedder == "stub":
+        embedder = StubEmbedder()
+        matrix = embedder.encode(kb.questions)
+    else:
+        from models.embeddings import EmbeddingModel
+        embedder = EmbeddingModel(config)
+        matrix = EmbeddingIndex.load_or_build(kb, embedder, config).matrix
+    lexical = LexicalIndex(kb, normalize=partial(normalizer.normalize, spell_check=False))
+    retriever = RetrievalPipeline(kb, lexical, build_vector_index(matrix, config), config)
+    build_seconds = time.perf_counter() - start
+    _, build_peak = tracemalloc.get_traced_memory()
+
+    rng = random.Random(args.seed)
+    sample = sorted(rng.sample(range(len(kb)), min(args.questions, len(kb))))
+    variants = make_variants([kb.questions[row] for row in sample],
+                             normalizer.abbreviations, normalizer.synonyms, args.seed)
+    answer_ids = {}
+    answer_of = np.asarray([answer_ids.setdefault(answer, len(answer_ids)) for answer in kb.answers])
+
+    # One untimed pass under tracemalloc for peak memory while querying
+    tracemalloc.reset_peak()
+    all_queries = [normalizer.normalize(q) for name in VARIANTS for _, q in variants[name]]
+    for stage in STAGES:
+        run_stage(stage, retriever, embedder.encode, all_queries[:200], args.k)
+    _, query_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    report = {"embedder": embedder.model_name, "rows": len(kb), "k": args.k,
+              "accuracy": {}, "thresholds": {}, "latency": {},
+              "memory": {"kb_bytes": kb.memory_usage(), "build_peak_bytes": build_peak,
+                         "query_peak_bytes": query_peak},
+              "build_seconds": build_seconds}
+    latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    scored = []  # (correct, confident-at-any-threshold stage, score) per pipeline answer
+    for name in VARIANTS:
+        pairs = variants[name]
+        targets = answer_of[[sample[i] for i, _ in pairs]]
+        queries = [normalizer.normalize(q) for _, q in pairs]
+        for stage in STAGES:
+            ranked, stage_latencies = run_stage(stage, retriever, embedder.encode, queries, args.k)
+            latencies[stage].extend(stage_latencies)
+            if stage == "pipeline":
+                top1 = [bool(r) and answer_of[r[0].row] == t for r, t in zip(ranked, targets)]
+                scored.extend((hit, r[0].stage, r[0].score) for hit, r in zip(top1, ranked) if r)
+                topk = None
+            else:
+                top1 = [bool(r) and answer_of[r[0]] == t for r, t in zip(ranked, targets)]
+                topk = float(np.mean([t in answer_of[r] for r, t in zip(ranked, targets)]))
+            report["accuracy"][f"{name}/{stage}"] = {"n": len(pairs), "top1": float(np.mean(top1)),
+                                                     "topk": topk}
+
+    total = len(all_queries)
+    for threshold in THRESHOLDS:
+        answered = [hit for hit, stage, score in scored if stage in ("exact", "lexical") or score > threshold]
+        report["thresholds"][str(threshold)] = {
+            "answered": len(answered) / total,
+            "precision": float(np.mean(answered)) if answered else 0.0,
+        }
+    for stage in STAGES:
+        report["latency"][stage] = percentiles(latencies[stage])
+    report["latency"]["batch"] = percentiles(run_batched(retriever, embedder.encode, all_queries, 32))
+    return report
+
+
+def print_report(report: Dict):
+    print(f"{report['rows']} QA rows, embedder {report['embedder']}, built in {report['build_seconds']:.2f}s")
+    k = report["k"]
+    print(f"\n{'variant':<10} {'n':>5} " + " ".join(f"{s + ' @1':>12} {s + f' @{k}':>12}" for s in STAGES[:2])
+          + f" {'pipeline @1':>12}")
+    for name in VARIANTS:
+        cells = [report["accuracy"][f"{name}/{stage}"] for stage in STAGES]
+        print(f"{name:<10} {cells[0]['n']:>5} "
+              + " ".join(f"{c['top1']:12.1%} {c['topk']:12.1%}" for c in cells[:2])
+              + f" {cells[2]['top1']:12.1%}")
+
+    print(f"\n{'threshold':<10} {'answered':>9} {'precision':>10}")
+    for threshold, row in report["thresholds"].items():
+        print(f"{threshold:<10} {row['answered']:9.1%} {row['precision']:10.1%}")
+
+    print(f"\n{'stage':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries/s':>10}")
+    for stage, row in report["latency"].items():
+        print(f"{stage:<10} {row['p50_ms']:8.3f} {row['p95_ms']:8.3f} {row['p99_ms']:8.3f} {row['qps']:10.0f}")
+
+    memory = report["memory"]
+    print(f"\nknowledge base {memory['kb_bytes'] / 2 ** 20:.1f} MiB, "
+          f"peak traced {memory['build_peak_bytes'] / 2 ** 20:.1f} MiB building, "
+          f"{memory['query_peak_bytes'] / 2 ** 20:.1f} MiB querying")
+
+
+def regressions(report: Dict, baseline: Dict, max_accuracy_drop: float,
+                max_latency_increase: float, max_memory_increase: float) -> List[str]:
+    found = []
+    for key, row in baseline["accuracy"].items():
+        current = report["accuracy"].get(key)
+        for metric in ("top1", "topk"):
+            if current is None or row[metric] is None:
+                continue
+            if current[metric] < row[metric] - max_accuracy_drop:
+                found.append(f"{key} {metric} {row[metric]:.1%} -> {current[metric]:.1%}")
+    for stage, row in baseline.get("latency", {}).items():
+        current = report["latency"].get(stage)
+        if current and current["p95_ms"] > row["p95_ms"] * (1 + max_latency_increase):
+            found.append(f"{stage} p95 {row['p95_ms']:.3f}ms -> {current['p95_ms']:.3f}ms")
+    for key, value in baseline.get("memory", {}).items():
+        current = report["memory"].get(key, 0)
+        if current > value * (1 + max_memory_increase):
+            found.append(f"{key} {value / 2 ** 20:.1f} MiB -> {current / 2 ** 20:.1f} MiB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", type=Path, default=ROOT / "data")
+    parser.add_argument("--embedder", choices=["stub", "model"], default="stub")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--questions", type=int, default=500, help="questions sampled for variants")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--similarity-threshold", type=float, default=0.6)
+    parser.add_argument("--spell-check", action="store_true", help="normalize with SymSpell correction")
+    parser.add_argument("--baseline", type=Path, help="default: benchmarks/baselines/retrieval-<embedder>.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--timings", action="store_true",
+                        help="also save latency and memory (meaningful only on this machine)")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    parser.add_argument("--max-latency-increase", type=float, default=0.5)
+    parser.add_argument("--max-memory-increase", type=float, default=0.2)
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args()
+
+    report = evaluate(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    baseline_path = args.baseline or BASELINE_DIR / f"retrieval-{args.embedder}.json"
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        saved = report if args.timings else {key: value for key, value in report.items()
+                                              if key not in ("latency", "memory", "build_seconds")}
+        with open(baseline_path, "w") as f:
+            json.dump(saved, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+    elif baseline_path.exists():
+        with open(baseline_path) as f:
+            found = regressions(report, json.load(f), args.max_accuracy_drop,
+                                args.max_latency_increase, args.max_memory_increase)
+        if found:
+            print(f"\nRegressions against {baseline_path}:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
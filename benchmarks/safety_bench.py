@@ -0,0 +1,118 @@
+"""Per-message safety cost: old single-pass checker vs. the tiered engine.
+
+The corpus mixes ordinary questions, banned words, PII and mildly rude
+messages, with repeats like real traffic. By default the transformer tier
+is replaced by a constant-time stub so the cheap tiers and the escalation
+rate can be measured without downloading toxic-bert:
+
+    python -m benchmarks.safety_bench
+    python -m benchmarks.safety_bench --with-transformer
+"""
+import argparse
+import random
+import re
+import time
+
+from utils.config import Settings
+from utils.metrics import metrics
+from utils.safety_check import SafetyChecker
+
+BANNED = ["idiot", "stupid", "moron", "dumb", "loser", "trash"]
+QUESTIONS = [
+    "what are the admission requirements for computer science",
+    "when does the second semester exam start",
+    "how many credit units does a 300 level student need",
+    "who is the head of department for mechanical engineering",
+    "where can i pay my school fees",
+    "is there accommodation for first year students",
+    "how do i register my courses online",
+    "what is the cut off mark for medicine",
+]
+RUDE = ["this portal is useless", "i hate this timetable", "shut up and answer",
+        "your answers are nonsense", "damn this registration"]
+
+
+def make_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        roll = rng.random()
+        text = rng.choice(QUESTIONS)
+        if roll < 0.05:
+            text = f"{text} you {rng.choice(BANNED)}"
+        elif roll < 0.08:
+            text = f"{text}, email me at student{rng.randint(1, 999)}@uni.edu"
+        elif roll < 0.15:
+            text = rng.choice(RUDE)
+        elif roll < 0.5:
+            text = f"{text} {rng.randint(1, 10 ** 6)}"  # mostly unique messages
+        corpus.append(text)
+    return corpus
+
+
+def baseline_checker(classify):
+    """The previous check_input: banned-word scan, PII regex, transformer on every message"""
+    pii = re.compile(r"\b\d{10}\b|\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+
+    def check(text):
+        lowered = text.lower()
+        if any(word in lowered for word in BANNED):
+            return False, "banned_words"
+        if pii.search(text):
+            return False, "pii_detected"
+        result = classify([text])[0]
+        if result["label"] == "toxic" and result["score"] > 0.85:
+            return False, "toxic_content"
+        return True, ""
+    return check
+
+
+def stub_classifier(cost: float):
+    def classify(texts):
+        time.sleep(cost)  # one forward pass, amortized over the batch
+        return [{"label": "neutral", "score": 0.99} for _ in texts]
+    return classify
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--stub-cost", type=float, default=0.01,
+                        help="seconds per transformer call when stubbed")
+    parser.add_argument("--with-transformer", action="store_true")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages)
+    checker = SafetyChecker(Settings(banned_words=BANNED))
+    if not args.with_transformer:
+        checker._batcher.classify = stub_classifier(args.stub_cost)
+    classify = checker._batcher.classify
+
+    if args.with_transformer:
+        classify(["warm up"])
+    baseline = baseline_checker(classify)
+    sample = corpus[: min(len(corpus), 500)]  # the baseline is slow; time a prefix
+    start = time.perf_counter()
+    for text in sample:
+        baseline(text)
+    baseline_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+    metrics.reset()
+    start = time.perf_counter()
+    for i in range(0, len(corpus), args.batch_size):
+        checker.check_inputs(corpus[i:i + args.batch_size])
+    tiered_us = (time.perf_counter() - start) / len(corpus) * 1e6
+
+    verdicts = metrics.to_dict()["counters"].get("safety_verdicts_total", {})
+    tiers = metrics.to_dict()["histograms"].get("safety_tier_seconds", {})
+    print(f"baseline  {baseline_us:10.1f} us/message  (transformer on every message)")
+    print(f"tiered    {tiered_us:10.1f} us/message  ({baseline_us / tiered_us:.1f}x)")
+    print("decided by: " + ", ".join(f"{k.split('=')[1]} {int(v)}" for k, v in sorted(verdicts.items())))
+    print(f"escalation rate: {verdicts.get('tier=transformer', 0) / len(corpus):.2%}")
+    for key, stats in sorted(tiers.items()):
+        print(f"  {key.split('=')[1]:<12} mean {stats['mean'] * 1e6:9.1f} us  p99 {stats['p99'] * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Startup-time benchmark: lazy construction vs. eagerly loading every model.
+
+Each scenario runs in a fresh interpreter so import costs are included:
+
+    python -m benchmarks.startup_bench
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+SCENARIO = """
+import json, sys, time
+start = time.perf_counter()
+from models.fallback_models import FallbackGenerator
+from utils.safety_check import SafetyChecker
+from utils.config import config
+imported = time.perf_counter()
+fallback = FallbackGenerator(config)
+checker = SafetyChecker()
+constructed = time.perf_counter()
+if sys.argv[1] == "eager":
+    fallback.small_llm, checker.toxicity_classifier
+loaded = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "construct_s": constructed - imported,
+    "load_s": loaded - constructed,
+    "total_s": loaded - start,
+    "heavy_modules": sorted(m for m in ("torch", "transformers", "sentence_transformers")
+                            if m in sys.modules),
+}))
+"""
+
+
+def run(mode: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", SCENARIO, mode], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    for mode in ("lazy", "eager"):
+        result = run(mode)
+        print(f"{mode:<6} import {result['import_s']:.3f}s  construct {result['construct_s']:.3f}s"
+              f"  load {result['load_s']:.3f}s  total {result['total_s']:.3f}s"
+              f"  heavy modules: {', '.join(result['heavy_modules']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
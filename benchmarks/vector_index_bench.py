@@ -0,0 +1,76 @@
+"""Recall-vs-latency benchmark of the ANN backend against exact search.
+
+Runs on a synthetic clustered corpus so it needs no model download:
+
+    python -m benchmarks.vector_index_bench --rows 200000 --dim 384
+"""
+import argparse
+import time
+
+import numpy as np
+
+from core.vector_index import ExactIndex, IVFIndex
+
+
+def make_corpus(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    data = centers[labels] + 1.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    # Perturbed copies of corpus rows, like paraphrases of known questions
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, corpus.shape[0], count)]
+    noisy = picks + 0.5 * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def time_search(index, queries: np.ndarray, k: int):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k)[0])
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def recall(truth, found, k: int) -> float:
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / (k * len(truth))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.rows, args.dim, args.clusters)
+    queries = make_queries(corpus, args.queries)
+
+    exact = ExactIndex(corpus)
+    truth, exact_ms = time_search(exact, queries, args.k)
+    print(f"{'backend':<18}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"{'exact':<18}{1.0:>10.3f}{np.percentile(exact_ms, 50):>10.3f}"
+          f"{np.percentile(exact_ms, 95):>10.3f}")
+
+    start = time.perf_counter()
+    ivf = IVFIndex(corpus, n_lists=args.lists)
+    print(f"(ivf build: {ivf.n_lists} lists in {time.perf_counter() - start:.1f}s)")
+    for n_probe in args.probes:
+        ivf.n_probe = n_probe
+        found, ivf_ms = time_search(ivf, queries, args.k)
+        print(f"{f'ivf probe={n_probe}':<18}{recall(truth, found, args.k):>10.3f}"
+              f"{np.percentile(ivf_ms, 50):>10.3f}{np.percentile(ivf_ms, 95):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Callable, Generic, List, Optional, Set, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collects concurrent async requests into batches for a synchronous handler.
+
+    The first request in an empty queue opens a window of ``max_wait``
+    seconds; everything submitted within it (up to ``max_batch_size``) is
+    passed to ``handler`` as one list, run in the default executor so the
+    event loop keeps accepting requests meanwhile. Batches are dispatched
+    without waiting for the previous one, so a batch held up by a slow LLM
+    call doesn't delay the requests queued behind it. ``handler`` must
+    return one result per input, in order.
+    """
+
+    def __init__(self, handler: Callable[[List[T]], List[R]],
+                 max_batch_size: int = 32, max_wait: float = 0.005):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running: Set[asyncio.Task] = set()  # the loop only keeps weak references
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # Queues and tasks are bound to one event loop; rebuild on a new one
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item: T) -> R:
+        """Queue one item and wait for its result"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            task = self._loop.create_task(self._dispatch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self._loop.run_in_executor(None, self.handler, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
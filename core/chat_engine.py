@@ -1,83 +1,450 @@
-import json
-from typing import Dict, Tuple
-from sentence_transformers import util
+import asyncio
+import atexit
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
 from models.embeddings import EmbeddingModel
-from models.fallback_models import FallbackGenerator
+from models.fallback_models import FallbackAnswer, FallbackGenerator
 from core.preprocessing import TextNormalizer
 from core.memory_manager import MemoryManager
+from core.embedding_index import INDEX_DIRNAME, EmbeddingIndex
+from core.knowledge_base import KnowledgeBase
+from core.context_extractor import ContextExtractor
+from core.vector_index import VectorIndex, build_vector_index
+from core.lexical_index import LexicalIndex
+from core.retrieval import RetrievalPipeline
+from core.batching import MicroBatcher
+from core.response_cache import SemanticCache
+from core.hot_reload import DatasetWatcher, diff_records
+from core.llm_client import LLMClient, LLMUnavailable
+from models import registry
+from utils.metrics import metrics
+from utils.safety_check import SafetyChecker
+
+_CHUNK_RE = re.compile(r"\S+\s*")
+T = TypeVar("T")
+log = logging.getLogger(__name__)
+
+
+_FALLBACK_STAGES = {"semantic": "semantic_fallback", "default": "clarify"}
+
+
+def _fallback_stage(tier: str) -> str:
+    """Answer stage for a fallback tier; a knowledge-base match is kept apart from generated text,
+    and when no tier could answer the user is asked to clarify"""
+    return _FALLBACK_STAGES.get(tier, "fallback")
+
+
+class KnowledgeSnapshot(NamedTuple):
+    """Everything derived from one version of the dataset; replaced as a unit on reload"""
+    kb: KnowledgeBase
+    lexical: LexicalIndex
+    index: EmbeddingIndex
+    vector_index: VectorIndex
+    retriever: RetrievalPipeline
+    extractor: ContextExtractor
+
+
+class Answer(NamedTuple):
+    text: str
+    stage: str  # retrieval stage, "response_cache", "llm", "semantic_fallback", "fallback", "clarify" or "blocked"
+    confidence: float
+
+
+def _snapshot_field(name: str) -> property:
+    return property(lambda self: getattr(self._state, name),
+                    doc=f"``{name}`` of the current knowledge snapshot")
+
 
 class ChatEngine:
-    def __init__(self, config):
+    kb = _snapshot_field("kb")
+    qa_data = _snapshot_field("kb")  # record-list view of the same data
+    lexical = _snapshot_field("lexical")
+    index = _snapshot_field("index")
+    vector_index = _snapshot_field("vector_index")
+    retriever = _snapshot_field("retriever")
+
+    def __init__(self, config, preload: Optional[bool] = None):
+        """``preload`` (default: the ``preload_models`` setting) warms the models now.
+
+        A pre-fork server passes False: torch state must not be forked, so
+        ``after_fork`` warms them in each worker instead.
+        """
         self.config = config
         self.embedder = EmbeddingModel(config)
         self.normalizer = TextNormalizer(config)
         self.memory = MemoryManager(config)
         self.fallback = FallbackGenerator(config)
+        # Students may share their own email or phone number; only opt in to blocking PII
+        self.safety = SafetyChecker(config, check_pii=config["safety_check_pii"])
         
         # Load knowledge base
-        with open(config["data_path"]/"qa_dataset.json") as f:
-            self.qa_data = json.load(f)
+        self.qa_path = Path(config["data_path"]) / "qa_dataset.json"
+        kb = KnowledgeBase.from_json(self.qa_path)
+        
+        # Memory-map precomputed embeddings (rebuilt only if dataset/model changed)
+        index = EmbeddingIndex.load_or_build(kb, self.embedder, config)
+        self._state = self._build_state(kb, index)
+        # The fallback answers from whichever snapshot is current, with the same encoder
+        self.fallback.attach_index(lambda: self._state, self._embed)
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[DatasetWatcher] = None
         
-        # Precompute embeddings
-        self.question_embeds = self.embedder.encode(
-            [q["question"] for q in self.qa_data]
+        # Semantic cache of LLM answers per conversation context, invalidated when the dataset changes
+        self.response_cache = SemanticCache(
+            dim=self.index.dim,
+            threshold=config["response_cache_threshold"],
+            ttl=config["response_cache_ttl"],
+            max_entries=config["response_cache_size"],
+            dataset_hash=self.index.metadata["dataset_hash"],
+            path=config["response_cache_path"],
         )
+        atexit.register(self.response_cache.save)
+        self._batcher = MicroBatcher(
+            lambda items: self.process_queries(*map(list, zip(*items))),
+            max_batch_size=config["max_batch_size"],
+            max_wait=config["max_batch_wait"],
+        )
+        
+        # Heavy models load lazily; optionally warm them off the request path
+        if config["preload_models"] if preload is None else preload:
+            self.warm_up()
+        self.llm = LLMClient(config)
+        self.metrics = metrics
+        if config["hot_reload"]:
+            self.start_watcher()
+
+    @property
+    def question_embeds(self):
+        return self._state.index.matrix
+
+    def _build_state(self, kb: KnowledgeBase, index: EmbeddingIndex) -> KnowledgeSnapshot:
+        # Questions get the query's abbreviation and synonym rewrites (spelling is left alone)
+        lexical = LexicalIndex(kb, normalize=partial(self.normalizer.normalize, spell_check=False))
+        vector_index = build_vector_index(index.matrix, self.config)
+        retriever = RetrievalPipeline(kb, lexical, vector_index, self.config)
+        extractor = ContextExtractor.from_knowledge_base(kb, self.normalizer.replacements)
+        return KnowledgeSnapshot(kb, lexical, index, vector_index, retriever, extractor)
+
+    def reload(self, qa_data: Optional[List[Dict]] = None) -> Dict:
+        """Swap in an edited dataset (default: re-read qa_dataset.json); returns the record diff.
+
+        Only new questions are encoded. Queries already running keep the
+        snapshot they started with; later ones see the new one.
+        """
+        with self._reload_lock, metrics.timer("chat_reload_seconds"):
+            kb = KnowledgeBase.from_json(self.qa_path) if qa_data is None else KnowledgeBase(qa_data)
+            old = self._state
+            diff = diff_records(old.kb, kb)
+            unchanged = not (diff["added"] or diff["changed"] or diff["removed"])
+            if kb is old.kb or (unchanged and kb.questions == old.kb.questions):
+                return {**diff, "encoded": 0, "cache_dropped": 0}
+
+            index, encoded = EmbeddingIndex.update(
+                kb, old.index, old.kb, self.embedder,
+                Path(self.config["data_path"]) / INDEX_DIRNAME,
+                dtype=self.config["index_dtype"],
+            )
+            self._state = self._build_state(kb, index)
+
+            # Cached LLM answers to queries near a new or edited question are stale
+            touched = diff["added"] + diff["changed"]
+            dropped = self.response_cache.invalidate_near(
+                index.matrix[touched], self.config["similarity_threshold"],
+                dataset_hash=index.metadata["dataset_hash"],
+            )
+        metrics.counter("chat_reloads_total").inc()
+        log.info("Reloaded knowledge base: %d added, %d changed, %d removed, %d encoded, "
+                 "%d cached answers dropped", len(diff["added"]), len(diff["changed"]),
+                 diff["removed"], encoded, dropped)
+        return {**diff, "encoded": encoded, "cache_dropped": dropped}
 
-    def process_query(self, user_input: str) -> str:
+    def start_watcher(self, interval: Optional[float] = None):
+        """Reload automatically whenever qa_dataset.json changes"""
+        self.stop_watcher()
+        self._watcher = DatasetWatcher(
+            self.qa_path, self.reload,
+            interval=interval or self.config["reload_interval"],
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def warm_up(self):
+        """Load the embedding, local LLM and toxicity models in background threads"""
+        registry.warm_up(self.embedder._load_model, self.fallback.init_models)
+        self.safety.warm_up()
+
+    def after_fork(self):
+        """Reset per-process state in a forked worker; the knowledge base and index stay shared"""
+        self.embedder.cache.reopen()
+        self.normalizer.reopen()
+        self.memory.reopen()
+        self.llm.reset()
+        metrics.reset()
+        if self._watcher is not None:  # threads don't survive fork()
+            self.start_watcher(self._watcher.interval)
+        if self.config["preload_models"]:
+            self.warm_up()
+
+    def close(self):
+        """Persist the embedding and response caches and spill live sessions"""
+        self.embedder.cache.close()
+        self.response_cache.save()
+        self.memory.close()
+
+    def process_query(self, user_input: str, session_id: Optional[str] = None) -> str:
         """End-to-end query processing pipeline"""
-        # Step 1: Preprocess
-        clean_input = self.normalizer.normalize(user_input)
+        return self.process_queries([user_input], [session_id])[0]
+
+    async def aprocess_query(self, user_input: str, session_id: Optional[str] = None) -> str:
+        """Async entry point; concurrent calls are micro-batched together"""
+        return await self._batcher.submit((user_input, session_id))
+
+    async def aprocess_queries(self, user_inputs: List[str],
+                               session_ids: Optional[List[Optional[str]]] = None) -> List[str]:
+        session_ids = session_ids or [None] * len(user_inputs)
+        return await asyncio.gather(*(self.aprocess_query(text, session_id)
+                                      for text, session_id in zip(user_inputs, session_ids)))
+
+    def process_queries(self, user_inputs: List[str],
+                        session_ids: Optional[List[Optional[str]]] = None) -> List[str]:
+        """Batched pipeline: one embedding pass and one similarity search per batch.
+
+        ``session_ids`` gives each query's conversation (None: the default session).
+        """
+        return [answer.text for answer in self.answer_queries(user_inputs, session_ids)]
+
+    def answer_queries(self, user_inputs: List[str],
+                       session_ids: Optional[List[Optional[str]]] = None) -> List[Answer]:
+        """``process_queries`` with the stage that answered each query and its confidence"""
+        start = time.perf_counter()
+        session_ids = session_ids or [None] * len(user_inputs)
+        responses: List[Optional[Answer]] = [None] * len(user_inputs)
+        pending = []
+        with metrics.timer("chat_stage_seconds", stage="safety"):
+            verdicts = self.safety.check_inputs(user_inputs)
+        for i, (user_input, (safe, violation)) in enumerate(zip(user_inputs, verdicts)):
+            if not safe:
+                responses[i] = Answer(self.safety.get_safety_response(violation), "blocked", 0.0)
+                metrics.counter("chat_answers_total", stage="blocked").inc()
+            else:
+                pending.append((i, *self._preprocess(user_input, session_ids[i])))
         
-        # Step 2: Safety check
-        if self.normalizer.is_abusive(clean_input):
-            return config["abuse_response"]
+        # Step 4: Generate responses
+        generated = self._generate_responses(
+            [query for _, query, _ in pending], [context for _, _, context in pending],
+            [session_ids[i] for i, _, _ in pending],
+        )
         
-        # Step 3: Update context
-        self.memory.update_context(clean_input)
+        # Step 5: Post-process
+        for (i, query, _), (response, confidence, stage) in zip(pending, generated):
+            responses[i] = Answer(self._enrich_response(response), stage, confidence)
+            self.memory.add_turn(query, responses[i].text, session_ids[i])
         
-        # Step 4: Generate response
-        response, confidence = self._generate_response(clean_input)
+        # Every query in the batch waited for the whole batch
+        elapsed = time.perf_counter() - start
+        request_latency = metrics.histogram("chat_request_seconds")
+        for _ in user_inputs:
+            request_latency.observe(elapsed)
+        return responses
+
+    def stream_query(self, user_input: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """Like ``process_query``, but yields the response in chunks as soon as they exist"""
+        # Time spent waiting on the consumer between chunks isn't request latency
+        return metrics.timed_iter(self._stream_answer(user_input, session_id), "chat_request_seconds")
+
+    def _stream_answer(self, user_input: str, session_id: Optional[str]) -> Iterator[str]:
+        start = time.perf_counter()
+        first_chunk = metrics.histogram("chat_first_chunk_seconds")
+        with metrics.timer("chat_stage_seconds", stage="safety"):
+            safe, violation = self.safety.check_input(user_input)
+        if not safe:
+            metrics.counter("chat_answers_total", stage="blocked").inc()
+            first_chunk.observe(time.perf_counter() - start)
+            yield self.safety.get_safety_response(violation)
+            return
+        clean_input, context = self._preprocess(user_input, session_id)
+        state = self._state  # one snapshot for the whole request, even across a reload
         
-        # Step 5: Post-process
-        if confidence < 0.4:
-            return self.memory.request_clarification()
-        return self._enrich_response(response)
-
-    def _generate_response(self, query: str) -> Tuple[str, float]:
-        """Multi-stage response generation"""
-        # Stage 1: Exact match
-        for qa in self.qa_data:
-            if query.lower() == qa["question"].lower():
-                return qa["answer"], 1.0
+        result = self._retrieval_stage(
+            lambda embed: state.retriever.retrieve(clean_input, lambda text: embed(text)[0], *context))
+        if state.retriever.confident(result):
+            metrics.counter("chat_answers_total", stage=result.stage).inc()
+            answer = self._enrich_response(state.kb.answers[result.row])
+            self.memory.add_turn(clean_input, answer, session_id)
+            first_chunk.observe(time.perf_counter() - start)
+            yield from _CHUNK_RE.findall(answer)
+            return
         
-        # Stage 2: Semantic search
-        query_embed = self.embedder.encode(query)
-        scores = util.pytorch_cos_sim(query_embed, self.question_embeds)[0]
-        top_idx = scores.argmax().item()
+        query_embed = self._embed(clean_input)[0]
+        cached = self._cached_answer(query_embed, context)
+        if cached is not None:
+            self.memory.add_turn(clean_input, cached, session_id)
+            first_chunk.observe(time.perf_counter() - start)
+            yield from _CHUNK_RE.findall(cached)
+            return
         
-        if scores[top_idx] > 0.6:
-            return self.qa_data[top_idx]["answer"], float(scores[top_idx])
+        chunks = []
+        if self.config["use_openai"]:
+            try:
+                for chunk in metrics.timed_iter(self._stream_llm(clean_input, session_id),
+                                                "chat_stage_seconds", stage="llm"):
+                    if not chunks:
+                        metrics.counter("chat_answers_total", stage="llm").inc()
+                        first_chunk.observe(time.perf_counter() - start)
+                    chunks.append(chunk)
+                    yield chunk
+            except LLMUnavailable as e:
+                log.warning("LLM unavailable: %s", e)
+                if chunks:  # cut off mid-answer: keep what was sent, but don't cache it
+                    self.memory.add_turn(clean_input, "".join(chunks).strip(), session_id)
+                    return
+            else:
+                answer = "".join(chunks).strip()
+                self.memory.add_turn(clean_input, answer, session_id)
+                self.response_cache.put(clean_input, query_embed, answer, context)
+                return
+
+        # LLM disabled, or it failed before the first chunk: the fallback generator
+        # answers, and its answer stays out of the response cache
+        fallback = self._fallback(clean_input, query_embed, context, session_id)
+        metrics.counter("chat_answers_total", stage=_fallback_stage(fallback.tier)).inc()
+        for chunk in fallback.chunks:
+            if not chunks:
+                first_chunk.observe(time.perf_counter() - start)
+            chunks.append(chunk)
+            yield chunk
+        self.memory.add_turn(clean_input, "".join(chunks).strip(), session_id)
+
+    def _preprocess(self, user_input: str, session_id: Optional[str] = None
+                    ) -> Tuple[str, Tuple[Optional[str], ...]]:
+        """Steps 1 and 3 (safety runs first, on the raw input); returns the clean input and (department, level, faculty)"""
+        # Step 1: Preprocess
+        with metrics.timer("chat_stage_seconds", stage="normalize"):
+            clean_input = self.normalizer.normalize(user_input)
         
-        # Stage 3: LLM generation
+        # Step 3: Update context
+        with metrics.timer("chat_stage_seconds", stage="context"):
+            self.memory.update_context(clean_input, session_id, self._state.extractor)
+        session = self.memory.session(session_id)
+        return clean_input, (session.department, session.level, session.faculty)
+
+    def _enrich_response(self, response: str) -> str:
+        return response.strip()
+
+    def _embed(self, texts):
+        with metrics.timer("chat_stage_seconds", stage="embed"):
+            return self.embedder.encode(texts)
+
+    def _retrieval_stage(self, run: Callable[[Callable], T]) -> T:
+        """``run(embed)`` timed as the retrieval stage; time inside ``embed`` is the embed stage's alone"""
+        embed_seconds = 0.0
+
+        def embed(texts):
+            nonlocal embed_seconds
+            start = time.perf_counter()
+            try:
+                return self._embed(texts)
+            finally:
+                embed_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
         try:
-            llm_response = self._call_llm(query)
-            return llm_response, 0.5
-        except Exception:
-            return self.fallback.generate(query), 0.3
+            return run(embed)
+        finally:
+            metrics.histogram("chat_stage_seconds", stage="retrieval").observe(
+                time.perf_counter() - start - embed_seconds)
+
+    def _cached_answer(self, query_embed, context: Tuple[Optional[str], ...]) -> Optional[str]:
+        with metrics.timer("chat_stage_seconds", stage="response_cache"):
+            cached = self.response_cache.get(query_embed, context)
+        result = "miss" if cached is None else "hit"
+        metrics.counter("chat_cache_lookups_total", cache="response", result=result).inc()
+        if cached is not None:
+            metrics.counter("chat_answers_total", stage="response_cache").inc()
+        return cached
+
+    def _generate_responses(self, queries: List[str],
+                            contexts: List[Tuple[Optional[str], ...]],
+                            session_ids: List[Optional[str]]) -> List[Tuple[str, float, str]]:
+        """Multi-stage response generation; (response, confidence, stage) per query"""
+        if not queries:
+            return []
+        
+        # Stages 1-2: Exact/BM25 match, then embedding re-rank of lexical
+        # candidates filtered by the known department/level
+        state = self._state  # one snapshot for the whole batch, even across a reload
+        results = self._retrieval_stage(lambda embed: state.retriever.retrieve_batch(queries, embed, contexts))
+        
+        responses: List[Optional[Tuple[str, float, str]]] = [None] * len(queries)
+        llm_bound = []
+        for i, (query, result, context, session_id) in enumerate(zip(queries, results, contexts, session_ids)):
+            if state.retriever.confident(result):
+                metrics.counter("chat_answers_total", stage=result.stage).inc()
+                responses[i] = (state.kb.answers[result.row], result.score, result.stage)
+                continue
             
-    # Add to ChatEngine class
-    def _call_llm(self, query: str) -> str:
-        """Attempt LLM response with fallback"""
-        try:
-            if self.config["use_openai"]:  # Set in config
-                messages = self.memory.build_llm_prompt(query)
-                response = openai.ChatCompletion.create(
-                    model="gpt-4",
-                    messages=messages,
-                    temperature=0.5
-                )
-                return response.choices[0].message.content
-            raise Exception("OpenAI disabled in config")  # Force fallback
-        except Exception as e:
-            print(f"LLM Error: {e}")
-            return self.fallback.generate(query)
+            # Stage 3: Semantic cache of earlier LLM answers (encode hits the embedding cache)
+            query_embed = self._embed(query)[0]
+            cached = self._cached_answer(query_embed, context)
+            if cached is not None:
+                responses[i] = (cached, 0.5, "response_cache")
+                continue
+            llm_bound.append((i, query, query_embed, context, session_id))
+        
+        # Stage 4: LLM generation. The calls run concurrently (LLMClient caps how
+        # many reach upstream), so the batch waits for its slowest answer, not their sum
+        if len(llm_bound) > 1 and self.config["use_openai"]:
+            with ThreadPoolExecutor(min(len(llm_bound), self.llm.max_concurrency),
+                                    thread_name_prefix="chat-llm") as pool:
+                generated = list(pool.map(lambda job: self._generate(*job[1:]), llm_bound))
+        else:
+            generated = [self._generate(*job[1:]) for job in llm_bound]
+        for (i, *_), response in zip(llm_bound, generated):
+            responses[i] = response
+        return responses
+
+    def _generate(self, query: str, query_embed, context: Tuple[Optional[str], ...],
+                  session_id: Optional[str]) -> Tuple[str, float, str]:
+        """Stage 4 for one query: the LLM when enabled and reachable, else the fallback generator"""
+        if self.config["use_openai"]:
+            try:
+                with metrics.timer("chat_stage_seconds", stage="llm"):
+                    llm_response = self._call_llm(query, session_id)
+            except LLMUnavailable as e:
+                log.warning("LLM unavailable: %s", e)
+            else:
+                metrics.counter("chat_answers_total", stage="llm").inc()
+                self.response_cache.put(query, query_embed, llm_response, context)  # only real LLM answers
+                return llm_response, 0.5, "llm"
+        fallback = self._fallback(query, query_embed, context, session_id)
+        stage = _fallback_stage(fallback.tier)
+        metrics.counter("chat_answers_total", stage=stage).inc()
+        # A semantic fallback is a knowledge-base answer, as confident as its match
+        confidence = {"semantic": fallback.score, "default": 0.0}.get(fallback.tier, 0.3)
+        return "".join(fallback.chunks).strip(), confidence, stage
+
+    def _fallback(self, query: str, query_embed, context: Tuple[Optional[str], ...],
+                  session_id: Optional[str]) -> FallbackAnswer:
+        """Fallback generator's answer; if only its canned default is left, a clarifying question instead"""
+        fallback = self.fallback.stream(query, query_embed, context)
+        if fallback.tier == "default":
+            return fallback._replace(chunks=iter([self.memory.request_clarification(session_id)]))
+        return fallback
+            
+    def _call_llm(self, query: str, session_id: Optional[str] = None) -> str:
+        """Complete LLM answer; raises ``LLMUnavailable`` (a cut-off answer counts as a failure)"""
+        return "".join(self._stream_llm(query, session_id)).strip()
+
+    def _stream_llm(self, query: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """Stream OpenAI completion chunks; raises ``LLMUnavailable`` when the call fails"""
+        yield from self.llm.stream(self.memory.build_llm_prompt(query, session_id))
@@ -0,0 +1,108 @@
+"""Context slots (department, faculty, level) read from a message in one pass."""
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional
+
+from core.knowledge_base import KnowledgeBase, department_names, normalize_department, parse_level_range
+from utils.text_match import trie_pattern
+
+_PREFIX_RE = re.compile(r"^dep[a-z]*ment of\s+", re.IGNORECASE)
+_ORDINALS = {
+    "first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3,
+    "fourth": 4, "4th": 4, "fifth": 5, "5th": 5, "sixth": 6, "6th": 6,
+}
+# Only after "year": "year one" is a level, "one year" a duration
+_YEAR_NUMBERS = {
+    **_ORDINALS,
+    "one": 1, "1": 1, "two": 2, "2": 2, "three": 3, "3": 3,
+    "four": 4, "4": 4, "five": 5, "5": 5, "six": 6, "6": 6,
+}
+
+
+def _display_names(values: Iterable[str]) -> Dict[str, str]:
+    """Normalized department name -> how the dataset spells it ('computer science' -> 'Computer Science')"""
+    names: Dict[str, str] = {}
+    for value in values:
+        for part in value.split(","):
+            name = normalize_department(part)
+            spelled = _PREFIX_RE.sub("", " ".join(part.split()))
+            if name and (name not in names or spelled.lower() == name):
+                names[name] = spelled if spelled.lower() == name else name.title()
+    return names
+
+
+class ContextExtractor:
+    """Finds department, faculty and level mentions with one compiled regex.
+
+    Every department and faculty in the dataset (and any alias pointing at
+    one) is folded into a trie alternation next to the level patterns
+    ("300 level", "level 300", "third year"), so a message is scanned once
+    however many departments there are. The last mention of each slot wins.
+    """
+
+    def __init__(self, departments: Mapping[str, str], faculties: Mapping[str, str],
+                 levels: Iterable[int]):
+        self.departments = {alias.lower(): name for alias, name in departments.items()}
+        self.faculties = {alias.lower(): name for alias, name in faculties.items()}
+        self.levels = sorted(set(levels))
+
+        alternatives = []
+        if self.departments:
+            alternatives.append(f"(?P<department>{trie_pattern(self.departments)})")
+        if self.faculties:
+            alternatives.append(f"(?P<faculty>{trie_pattern(self.faculties)})")
+        if self.levels:
+            level = trie_pattern(str(value) for value in self.levels)
+            ordinals = [word for word, n in _ORDINALS.items() if n * 100 in self.levels]
+            numbers = [word for word, n in _YEAR_NUMBERS.items() if n * 100 in self.levels]
+            alternatives.append(rf"(?:level|lvl)\s*(?P<level>{level})|(?P<level_number>{level})\s*(?:level|lvl|l)")
+            # "third year" or "year 3", but not "3 year(s)" or "five year programme", which are durations
+            alternatives.append(rf"(?P<year>{trie_pattern(ordinals)})\s+year"
+                                rf"|year\s+(?P<year_number>{trie_pattern(numbers)})")
+        self._pattern = re.compile(rf"\b(?:{'|'.join(alternatives)})\b", re.IGNORECASE) if alternatives else None
+
+    @classmethod
+    def from_knowledge_base(cls, kb: KnowledgeBase,
+                            aliases: Optional[Mapping[str, str]] = None) -> "ContextExtractor":
+        """Slots from the dataset's distinct values; ``aliases`` (e.g. abbreviations) may add names"""
+        departments = _display_names(kb.distinct("department"))
+        faculties = {value: value for value in kb.distinct("faculty") if value}
+        for alias, target in (aliases or {}).items():
+            names = department_names(target)
+            if len(names) == 1 and names[0] in departments:
+                departments[alias] = departments[names[0]]
+            elif target.lower() in map(str.lower, faculties):
+                faculties[alias] = next(v for v in faculties if v.lower() == target.lower())
+
+        levels = set()
+        for value in kb.distinct("level"):
+            low, high = parse_level_range(value)
+            levels.update(range(low, high + 1, 100) if low else ())
+        return cls(departments, faculties, levels)
+
+    @classmethod
+    def from_config(cls, config) -> "ContextExtractor":
+        """Extractor for the configured dataset, with abbreviations and synonyms as aliases"""
+        kb = config.get("qa_data")
+        if kb is None:
+            path = Path(config["data_path"]) / "qa_dataset.json"
+            kb = KnowledgeBase.from_json(path) if path.exists() else KnowledgeBase([])
+        aliases = {**config.get("abbreviations", {}), **config.get("synonyms", {})}
+        return cls.from_knowledge_base(kb, aliases)
+
+    def extract(self, text: str) -> Dict[str, str]:
+        """Slots mentioned in ``text``, e.g. {'department': 'Computer Science', 'level': '300'}"""
+        found: Dict[str, str] = {}
+        if self._pattern is None:
+            return found
+        for match in self._pattern.finditer(text):
+            slot, value = match.lastgroup, match.group(match.lastgroup).lower()
+            if slot == "department":
+                found["department"] = self.departments[value]
+            elif slot == "faculty":
+                found["faculty"] = self.faculties[value]
+            elif slot in ("level", "level_number"):
+                found["level"] = value
+            else:
+                found["level"] = str(_YEAR_NUMBERS[value] * 100)
+        return found
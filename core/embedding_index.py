@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.knowledge_base import KnowledgeBase, question_column
+from utils.config import Settings
+
+INDEX_VERSION = 1
+INDEX_DIRNAME = "index"
+
+
+def dataset_hash(qa_data: List[Dict[str, str]]) -> str:
+    """Content hash of the embedded questions, in row order"""
+    digest = hashlib.sha256()
+    for question in question_column(qa_data):
+        digest.update(question.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+
+class EmbeddingIndex:
+    """Versioned, memory-mapped matrix of question embeddings.
+
+    The matrix lives in a ``.npy`` file next to a small JSON metadata file,
+    both keyed by model name and dataset hash. Loading uses ``mmap_mode="r"``
+    so every worker process maps the same read-only pages.
+
+    ``index_dtype="float16"`` halves the file and resident memory. It is
+    storage only: rows are upcast to float32 for scoring, which makes a
+    full-index search roughly 2-3x slower than with a float32 matrix.
+    """
+
+    def __init__(self, matrix: np.ndarray, metadata: Dict):
+        self.matrix = matrix
+        self.metadata = metadata
+        self.ids = metadata["ids"]
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @staticmethod
+    def paths(index_dir: Path, model_name: str, data_hash: str):
+        stem = f"{_model_slug(model_name)}-{data_hash[:16]}"
+        return index_dir / f"{stem}.npy", index_dir / f"{stem}.json"
+
+    @classmethod
+    def load(cls, qa_data: List[Dict[str, str]], model_name: str,
+             index_dir: Path) -> Optional["EmbeddingIndex"]:
+        """Memory-map an existing index, or return None if it is missing or stale"""
+        data_hash = dataset_hash(qa_data)
+        matrix_path, meta_path = cls.paths(Path(index_dir), model_name, data_hash)
+        if not (matrix_path.exists() and meta_path.exists()):
+            return None
+
+        with open(meta_path) as f:
+            metadata = json.load(f)
+        if (metadata.get("version") != INDEX_VERSION
+                or metadata.get("model") != model_name
+                or metadata.get("dataset_hash") != data_hash):
+            return None
+
+        matrix = np.load(matrix_path, mmap_mode="r")
+        if matrix.shape[0] != len(qa_data):
+            return None
+        return cls(matrix, metadata)
+
+    @classmethod
+    def build(cls, qa_data: List[Dict[str, str]], embedder, index_dir: Path,
+              dtype: str = "float32") -> "EmbeddingIndex":
+        """Encode all questions and write the index files atomically"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        embeddings = embedder.encode(question_column(qa_data))
+        return cls._write(embeddings, qa_data, embedder.model_name, index_dir, dtype)
+
+    @classmethod
+    def update(cls, qa_data: List[Dict[str, str]], previous: "EmbeddingIndex",
+               previous_qa: List[Dict[str, str]], embedder, index_dir: Path,
+               dtype: str = "float32") -> Tuple["EmbeddingIndex", int]:
+        """Index for an edited dataset, encoding only questions ``previous`` lacks.
+
+        Returns the index and how many questions were encoded. If another
+        process already wrote the index for this dataset, it is just mapped.
+        """
+        index_dir = Path(index_dir)
+        existing = cls.load(qa_data, embedder.model_name, index_dir)
+        if existing is not None:
+            return existing, 0
+
+        questions = question_column(qa_data)
+        old_rows = {question: row for row, question in enumerate(question_column(previous_qa))}
+        reused = [(row, old_rows[question]) for row, question in enumerate(questions)
+                  if question in old_rows]
+        missing = [row for row, question in enumerate(questions) if question not in old_rows]
+
+        matrix = np.empty((len(qa_data), previous.dim), dtype=np.float32)
+        if reused:
+            new, old = zip(*reused)
+            matrix[list(new)] = previous.matrix[list(old)]
+        if missing:
+            matrix[missing] = embedder.encode([questions[row] for row in missing])
+        index_dir.mkdir(parents=True, exist_ok=True)
+        return cls._write(matrix, qa_data, embedder.model_name, index_dir, dtype), len(missing)
+
+    @classmethod
+    def _write(cls, embeddings: np.ndarray, qa_data: List[Dict[str, str]], model_name: str,
+               index_dir: Path, dtype: str) -> "EmbeddingIndex":
+        data_hash = dataset_hash(qa_data)
+        matrix_path, meta_path = cls.paths(index_dir, model_name, data_hash)
+        matrix = np.ascontiguousarray(embeddings, dtype=dtype)
+        metadata = {
+            "version": INDEX_VERSION,
+            "model": model_name,
+            "dataset_hash": data_hash,
+            "dtype": dtype,
+            "rows": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]),
+            "ids": list(range(len(qa_data))),
+        }
+
+        # Write to temp files then rename, so readers never see partial files
+        tmp_matrix = matrix_path.with_suffix(f".{os.getpid()}.tmp.npy")
+        tmp_meta = meta_path.with_suffix(f".{os.getpid()}.tmp")
+        np.save(tmp_matrix, matrix)
+        with open(tmp_meta, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_matrix, matrix_path)
+        os.replace(tmp_meta, meta_path)
+
+        cls._remove_stale(index_dir, model_name, keep=matrix_path.stem)
+        return cls(np.load(matrix_path, mmap_mode="r"), metadata)
+
+    @classmethod
+    def load_or_build(cls, qa_data: List[Dict[str, str]], embedder,
+                      config) -> "EmbeddingIndex":
+        """Load the on-disk index, rebuilding only when dataset or model changed"""
+        index_dir = Path(config["data_path"]) / INDEX_DIRNAME
+        index = cls.load(qa_data, embedder.model_name, index_dir)
+        if index is None:
+            index = cls.build(qa_data, embedder, index_dir,
+                              dtype=config["index_dtype"])
+        return index
+
+    @staticmethod
+    def _remove_stale(index_dir: Path, model_name: str, keep: str):
+        prefix = f"{_model_slug(model_name)}-"
+        for path in index_dir.glob(f"{prefix}*"):
+            if (path.stem != keep and ".tmp" not in path.name
+                    and path.suffix in (".npy", ".json")):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+def main():
+    from models.embeddings import EmbeddingModel
+
+    parser = argparse.ArgumentParser(description="Build the QA embedding index")
+    parser.add_argument("--data-dir", type=Path,
+                        default=Path(__file__).parent.parent / "data")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    args = parser.parse_args()
+
+    config = Settings(data_dir=args.data_dir, embedding_model=args.model, embedding_backend=args.backend)
+    qa_data = KnowledgeBase.from_json(args.data_dir / "qa_dataset.json")
+
+    index = EmbeddingIndex.build(qa_data, EmbeddingModel(config),
+                                 args.data_dir / INDEX_DIRNAME, dtype=args.dtype)
+    print(f"Built index: {len(index)} rows x {index.dim} dims ({args.dtype})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Dataset change detection for hot reloading the knowledge base."""
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from utils.config import file_signature
+
+log = logging.getLogger(__name__)
+
+
+def record_hash(qa: Dict) -> str:
+    """Content hash of one QA record (every field, key order ignored)"""
+    encoded = json.dumps(qa, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def diff_records(old: List[Dict], new: List[Dict]) -> Dict:
+    """Compare two datasets record by record.
+
+    Returns new-row indexes of ``added`` (question not seen before) and
+    ``changed`` (same question, other fields differ) records, plus counts of
+    ``removed`` and ``unchanged`` ones.
+    """
+    old_hashes = {record_hash(qa) for qa in old}
+    new_hashes = [record_hash(qa) for qa in new]
+    old_questions = {qa["question"] for qa in old}
+    new_questions = {qa["question"] for qa in new}
+
+    added, changed = [], []
+    for row, (qa, digest) in enumerate(zip(new, new_hashes)):
+        if digest in old_hashes:
+            continue
+        (changed if qa["question"] in old_questions else added).append(row)
+    return {
+        "added": added,
+        "changed": changed,
+        "removed": len(old_questions - new_questions),
+        "unchanged": len(new) - len(added) - len(changed),
+    }
+
+
+class DatasetWatcher(threading.Thread):
+    """Polls a file and calls ``on_change`` once its size and mtime have settled.
+
+    Polling (rather than inotify) keeps this dependency-free and works on
+    network mounts; a change is reported only after two identical stats in a
+    row, so a half-written file isn't picked up mid-copy.
+    """
+
+    def __init__(self, path: Path, on_change: Callable[[], None], interval: float = 2.0):
+        super().__init__(name="dataset-watcher", daemon=True)
+        self.path = Path(path)
+        self.on_change = on_change
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._seen = file_signature(self.path)
+
+    def run(self):
+        pending = None
+        while not self._stopped.wait(self.interval):
+            signature = file_signature(self.path)
+            if signature is None or signature == self._seen:
+                pending = None
+            elif signature != pending:
+                pending = signature  # changed; wait one more tick for it to settle
+            else:
+                self._seen, pending = signature, None
+                try:
+                    self.on_change()
+                except Exception:
+                    log.exception("Reload of %s failed", self.path)
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,185 @@
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from utils.config import file_signature, load_qa_dataset
+
+_LEVEL_RE = re.compile(r"\d{3}")
+_DEPARTMENT_PREFIX_RE = re.compile(r"^dep[a-z]*ment of\s+")  # also the dataset's "Deparment of"
+_PARENTHETICAL_RE = re.compile(r"^(.*?)\s*\(([^)]*)\)$")
+_TEXT_FIELDS = ("question", "answer")
+_MISSING = object()  # field absent from a record, as opposed to null or ""
+
+
+def normalize_department(value: Optional[str]) -> str:
+    """'Department Of  Nursing' and 'nursing' both become 'nursing'; 'Chemical Sciences (Biochemistry)' 'biochemistry'"""
+    value = _DEPARTMENT_PREFIX_RE.sub("", " ".join((value or "").lower().split()))
+    match = _PARENTHETICAL_RE.match(value)
+    if match:
+        outer, inner = match.groups()
+        value = inner if inner.replace(" ", "").isalpha() else outer  # 'law (ll.b)' stays 'law'
+    return value
+
+
+def department_names(value: Optional[str]) -> Tuple[str, ...]:
+    """Normalized names in a department field, which may list several ('Anatomy, Nursing')"""
+    return tuple(name for name in map(normalize_department, (value or "").split(",")) if name)
+
+
+def parse_level_range(value: Optional[str]) -> Tuple[int, int]:
+    """'200', '100 level' or '200 level - 400level' as (low, high); (0, 0) if unset"""
+    levels = [int(v) for v in _LEVEL_RE.findall(str(value or ""))]
+    return (min(levels), max(levels)) if levels else (0, 0)
+
+
+def question_column(qa_data) -> List[str]:
+    """Questions of a ``KnowledgeBase`` or of a plain list of records"""
+    if isinstance(qa_data, KnowledgeBase):
+        return qa_data.questions
+    return [qa["question"] for qa in qa_data]
+
+
+class _Column:
+    """Dictionary-encoded column: each distinct value stored once, rows hold integer codes"""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, raw: List[Any]):
+        lookup: Dict[Any, int] = {}
+        codes = [lookup.setdefault(value, len(lookup)) for value in raw]
+        self.values: List[Any] = list(lookup)
+        dtype = np.uint8 if len(lookup) <= 1 << 8 else np.uint16 if len(lookup) <= 1 << 16 else np.uint32
+        self.codes = np.asarray(codes, dtype=dtype)
+
+    def table(self, func) -> np.ndarray:
+        """``func`` applied to each distinct value (None if absent), indexable by code"""
+        return np.asarray([func(None if value is _MISSING else value) for value in self.values])
+
+
+class KnowledgeBase(Sequence):
+    """Column-wise, read-only store of the QA records.
+
+    Questions and answers are plain string lists; every other field
+    (department, level, topic, ...) is dictionary-encoded into a small NumPy
+    code array, so metadata filters are vectorized lookups instead of Python
+    loops. Indexing or iterating still yields the original record dicts
+    (built on demand), so code written against ``List[Dict]`` keeps working;
+    hot paths should use ``questions``/``answers``/``mask`` directly.
+    """
+
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        records = list(records)
+        self.ids = np.arange(len(records), dtype=np.int32)
+        self.questions: List[str] = [sys.intern(qa["question"]) for qa in records]
+        self.answers: List[str] = [qa["answer"] for qa in records]
+
+        fields: Dict[str, None] = {}
+        for qa in records:
+            fields.update(dict.fromkeys(k for k in qa if k not in _TEXT_FIELDS))
+        self.columns: Dict[str, _Column] = {
+            name: _Column([qa.get(name, _MISSING) for qa in records]) for name in fields
+        }
+
+        # Level ranges, parsed once per distinct value
+        level = self.columns.get("level")
+        if level:
+            ranges = level.table(parse_level_range).astype(np.int16).reshape(-1, 2)
+            self.level_low, self.level_high = ranges[level.codes, 0], ranges[level.codes, 1]
+        else:
+            self.level_low = self.level_high = np.zeros(len(records), dtype=np.int16)
+
+    @classmethod
+    def from_json(cls, path: Path) -> "KnowledgeBase":
+        """Shared instance for a QA file, rebuilt only when the file changes"""
+        path = Path(path).resolve()
+        signature = file_signature(path)
+        with _shared_lock:
+            cached = _shared.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        kb = cls(load_qa_dataset(path))
+        with _shared_lock:
+            _shared[path] = (signature, kb)
+        return kb
+
+    # --- Record access ---
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def __getitem__(self, row: Union[int, slice]):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        record = {"question": self.questions[row], "answer": self.answers[row]}
+        for name, column in self.columns.items():
+            value = column.values[column.codes[row]]
+            if value is not _MISSING:
+                record[name] = value
+        return record
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[row] for row in range(len(self)))
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    def distinct(self, name: str) -> List[Any]:
+        """Distinct values of a categorical field"""
+        return [v for v in self.columns[name].values if v is not _MISSING] if name in self.columns else []
+
+    # --- Vectorized filters ---
+
+    def field_mask(self, name: str, value: str) -> np.ndarray:
+        """Rows whose field equals ``value`` (case-insensitive) or is unset"""
+        column = self.columns.get(name)
+        if column is None:
+            return np.ones(len(self), dtype=bool)
+        wanted = " ".join(value.lower().split())
+        allowed = column.table(lambda v: not v or " ".join(str(v).lower().split()) == wanted)
+        return allowed[column.codes]
+
+    def mask(self, department: Optional[str] = None, level: Optional[str] = None,
+             **fields: Optional[str]) -> Optional[np.ndarray]:
+        """Rows compatible with the given context; general (unset) rows always pass.
+
+        ``department`` matches rows listing it (after ``normalize_department``),
+        ``level`` each row's level range, other fields (``faculty=...``) exactly.
+        Returns None when nothing is constrained.
+        """
+        mask = None
+        column = self.columns.get("department")
+        if department and column is not None:
+            dept = normalize_department(department)
+            allowed = column.table(lambda v: not department_names(v) or dept in department_names(v))
+            mask = allowed[column.codes]
+        level_value = parse_level_range(level)[0]
+        if level_value:
+            level_mask = (self.level_low == 0) | (
+                (self.level_low <= level_value) & (level_value <= self.level_high))
+            mask = level_mask if mask is None else mask & level_mask
+        for name, value in fields.items():
+            if value:
+                field_mask = self.field_mask(name, value)
+                mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held, counting each string object once"""
+        seen, total = set(), 0
+        for text in (*self.questions, *self.answers,
+                     *(v for c in self.columns.values() for v in c.values)):
+            if id(text) not in seen:
+                seen.add(id(text))
+                total += sys.getsizeof(text)
+        total += sys.getsizeof(self.questions) + sys.getsizeof(self.answers)
+        total += sum(c.codes.nbytes for c in self.columns.values())
+        total += self.ids.nbytes + self.level_low.nbytes + self.level_high.nbytes
+        return total
+
+
+_shared: Dict[Path, Tuple[Any, KnowledgeBase]] = {}
+_shared_lock = threading.Lock()
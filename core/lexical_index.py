@@ -0,0 +1,133 @@
+import math
+import re
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.knowledge_base import question_column
+from core.vector_index import top_k
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "at",
+    "to", "for", "and", "or", "do", "does", "did", "i", "you", "me", "my",
+    "it", "its", "this", "that", "what", "which", "who", "how", "can", "there",
+    "with", "about", "please", "tell",
+})
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form used for exact matching: lowercase words, no punctuation"""
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """Exact-match hash map plus a BM25 inverted index over QA questions.
+
+    BM25 term weights are precomputed per posting at build time, so scoring a
+    query is a few array gathers and a ``bincount`` over the touched rows.
+    ``normalize`` is applied to every question first; pass the one queries go
+    through, so a question asked verbatim still lands on its exact entry.
+    """
+
+    def __init__(self, qa_data: List[Dict[str, str]], k1: float = 1.2, b: float = 0.75,
+                 normalize: Optional[Callable[[str], str]] = None):
+        self.k1 = k1
+        self.size = len(qa_data)
+
+        questions = question_column(qa_data)
+        if normalize is not None:
+            questions = [normalize(question) for question in questions]
+        self.exact: Dict[str, int] = {}
+        for row, question in enumerate(questions):
+            self.exact.setdefault(normalize_question(question), row)
+
+        docs = [tokenize(question) for question in questions]
+        lengths = np.array([len(d) for d in docs], dtype=np.float32)
+        avg_length = float(lengths.mean()) if self.size else 0.0
+
+        postings = defaultdict(dict)
+        for row, terms in enumerate(docs):
+            for term in terms:
+                postings[term][row] = postings[term].get(row, 0) + 1
+
+        self.idf: Dict[str, float] = {}
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.row_weight = np.zeros(self.size, dtype=np.float32)  # idf sum of each row's distinct terms
+        for term, counts in postings.items():
+            rows = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            idf = math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = k1 * (1 - b + b * lengths[rows] / max(avg_length, 1e-9))
+            self.idf[term] = idf
+            self.row_weight[rows] += idf
+            self.postings[term] = (rows, (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+        self.max_idf = max(self.idf.values(), default=0.0)
+
+    def lookup_exact(self, query: str) -> Optional[int]:
+        """Row of a question identical to the query after normalization"""
+        return self.exact.get(normalize_question(query))
+
+    def search(self, query: str, k: int = 10,
+               mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """BM25 top-k as ``(row, score)``; ``mask`` optionally restricts rows"""
+        hits = [self.postings[t] for t in set(tokenize(query)) if t in self.postings]
+        if not hits:
+            return []
+        rows = np.concatenate([h[0] for h in hits])
+        weights = np.concatenate([h[1] for h in hits])
+        touched, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        if mask is not None:
+            keep = mask[touched]
+            touched, scores = touched[keep], scores[keep]
+            if touched.size == 0:
+                return []
+
+        # Touched rows are sorted, so ties go to the lower row id on every platform
+        best = top_k(scores, k)
+        return [(int(touched[i]), float(scores[i])) for i in best]
+
+    def ideal_score(self, query: str) -> float:
+        """Score of a one-occurrence match of every query term in an average-length row.
+
+        Unknown terms count at the maximum idf, so off-vocabulary queries score low.
+        """
+        return sum(self.idf.get(t, self.max_idf) for t in set(tokenize(query)))
+
+    def coverage(self, query: str, row: int) -> float:
+        """Share of the row's term weight (idf) that the query's terms account for"""
+        shared = 0.0
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                rows = self.postings[term][0]  # ascending
+                i = np.searchsorted(rows, row)
+                if i < rows.size and rows[i] == row:
+                    shared += self.idf[term]
+        return shared / self.row_weight[row] if self.row_weight[row] > 0 else 0.0
+
+    def best_match(self, query: str, min_ratio: float = 0.5,
+                   mask: Optional[np.ndarray] = None) -> Optional[Tuple[int, float]]:
+        """Exact row, else the top BM25 row if it reaches ``min_ratio`` of the ideal score
+        and the query covers at least ``min_ratio`` of that row's terms.
+
+        A short query ("hod") is contained in many rows; without the second
+        test any of them would match it fully. Returns ``(row, confidence)``
+        with confidence in ``[0, 1]``.
+        """
+        row = self.lookup_exact(query)
+        if row is not None and (mask is None or mask[row]):
+            return row, 1.0
+
+        hits = self.search(query, k=1, mask=mask)
+        ideal = self.ideal_score(query)
+        if not hits or ideal <= 0:
+            return None
+        row, score = hits[0]
+        ratio = min(score / ideal, self.coverage(query, row), 1.0)
+        return (row, ratio) if ratio >= min_ratio else None
@@ -0,0 +1,246 @@
+"""Shared client for an OpenAI-compatible chat-completions API.
+
+One ``openai.OpenAI`` instance per process keeps its HTTP connections alive
+between calls. Around it:
+
+- a semaphore caps concurrent upstream calls (``llm_max_concurrency``);
+  a caller that can't get a slot before its deadline fails fast
+- every call has a deadline of ``llm_timeout`` seconds, covering the whole
+  streamed answer, not just the first byte
+- identical requests already in flight are coalesced: only the first goes
+  upstream and the others replay its chunks as they arrive
+- a circuit breaker opens after ``llm_breaker_failures`` consecutive errors
+  or slow calls (over ``llm_slow_call`` seconds), rejects calls for
+  ``llm_breaker_cooldown`` seconds, then lets one trial call through
+
+Every failure surfaces as ``LLMUnavailable`` so the caller can switch to the
+local fallback. ``llm_base_url`` points the client at any compatible server,
+e.g. the stub in ``benchmarks/llm_client_bench.py``.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from utils.metrics import metrics
+
+
+class LLMUnavailable(Exception):
+    """The LLM call failed, timed out, or was refused by the breaker or the concurrency limit"""
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures -> half-open after ``cooldown``"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; in half-open state only one trial at a time"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state, self._trial_running = "half_open", False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def rejecting(self) -> bool:
+        """Open and still cooling down; checked without taking the half-open trial"""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            self.state, self._failures, self._trial_running = "closed", 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    metrics.counter("llm_breaker_opened_total").inc()
+                self.state, self._opened_at, self._trial_running = "open", time.monotonic(), False
+
+    def abandon(self):
+        """A call ended without a verdict (caller stopped reading); free the trial slot"""
+        with self._lock:
+            self._trial_running = False
+
+
+class _Flight:
+    """One upstream call whose chunks are replayed to every coalesced caller"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._cond = threading.Condition()
+
+    def publish(self, chunk: str):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[Exception] = None):
+        with self._cond:
+            self.done, self.error = True, error
+            self._cond.notify_all()
+
+    def follow(self, deadline: float) -> Iterator[str]:
+        seen = 0
+        while True:
+            with self._cond:
+                while seen == len(self.chunks) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMUnavailable("timed out waiting for an identical in-flight request")
+                    self._cond.wait(remaining)
+                new, done, error = self.chunks[seen:], self.done, self.error
+            seen += len(new)
+            yield from new
+            if done:
+                if error is not None:
+                    raise LLMUnavailable(f"coalesced request failed: {error}")
+                return
+
+
+class LLMClient:
+    """Pooled, bounded, coalescing chat-completions client with a circuit breaker"""
+
+    def __init__(self, config):
+        self.model = config["openai_model"]
+        self.base_url = config["llm_base_url"]
+        self.api_key = config["llm_api_key"]
+        self.timeout = config["llm_timeout"]
+        self.slow_call = config["llm_slow_call"]
+        self.max_retries = config["llm_max_retries"]
+        self.max_concurrency = config["llm_max_concurrency"]
+        self.breaker = CircuitBreaker(config["llm_breaker_failures"],
+                                      config["llm_breaker_cooldown"])
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._in_flight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._client = None
+
+    @property
+    def client(self):
+        """The ``openai.OpenAI`` client, created on first use; it owns the connection pool"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import openai
+
+                    api_key = self.api_key or os.environ.get("OPENAI_API_KEY")
+                    self._client = openai.OpenAI(
+                        base_url=self.base_url or None,
+                        api_key=api_key or ("unused" if self.base_url else None),
+                        timeout=self.timeout,
+                        max_retries=self.max_retries,
+                    )
+        return self._client
+
+    def reset(self):
+        """Fresh connections and state in a forked worker"""
+        self._client = None
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.breaker = CircuitBreaker(self.breaker.failure_threshold, self.breaker.cooldown)
+
+    def complete(self, messages: List[Dict[str, str]], **params) -> str:
+        return "".join(self.stream(messages, **params)).strip()
+
+    def stream(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+               temperature: float = 0.5) -> Iterator[str]:
+        """Answer chunks for a chat prompt; raises ``LLMUnavailable`` on any failure"""
+        model = model or self.model
+        deadline = time.monotonic() + self.timeout
+        key = hashlib.sha1(json.dumps([model, temperature, messages], sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+        if not leader:
+            metrics.counter("llm_requests_total", result="coalesced").inc()
+            yield from flight.follow(deadline)
+            return
+
+        error: Optional[Exception] = None
+        try:
+            for chunk in self._call(model, messages, temperature, deadline):
+                flight.publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            error = LLMUnavailable("the first caller stopped reading")
+            raise
+        except LLMUnavailable as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+            flight.finish(error)
+
+    def _call(self, model: str, messages: List[Dict[str, str]], temperature: float,
+              deadline: float) -> Iterator[str]:
+        if self.breaker.rejecting():  # don't queue for a slot just to be rejected
+            metrics.counter("llm_requests_total", result="rejected").inc()
+            raise LLMUnavailable("circuit breaker open")
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            metrics.counter("llm_requests_total", result="busy").inc()
+            raise LLMUnavailable(f"all {self.max_concurrency} LLM slots busy")
+        start = time.monotonic()
+        result = "error"
+        try:
+            if not self.breaker.allow():
+                result = "rejected"
+                raise LLMUnavailable("circuit breaker open")
+            try:
+                stream = self.client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, stream=True,
+                    timeout=max(0.001, deadline - time.monotonic()),
+                )
+                try:
+                    for event in stream:
+                        if time.monotonic() > deadline:
+                            result = "timeout"
+                            raise LLMUnavailable(f"no complete answer within {self.timeout}s")
+                        delta = event.choices[0].delta.content if event.choices else None
+                        if delta:
+                            yield delta
+                finally:
+                    stream.close()
+            except GeneratorExit:
+                result = "abandoned"
+                self.breaker.abandon()
+                raise
+            except LLMUnavailable:
+                self.breaker.record_failure()
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                raise LLMUnavailable(str(e)) from e
+            if time.monotonic() - start > self.slow_call:
+                result = "slow"
+                self.breaker.record_failure()  # answered, but slow enough to shed load upstream
+            else:
+                result = "ok"
+                self.breaker.record_success()
+        finally:
+            self._slots.release()
+            metrics.counter("llm_requests_total", result=result).inc()
+            if result != "rejected":
+                metrics.histogram("llm_request_seconds").observe(time.monotonic() - start)
@@ -1,23 +1,253 @@
-from collections import deque
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.context_extractor import ContextExtractor
+
+DEFAULT_SESSION = "default"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); good enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+class Turn:
+    """One user message and the reply to it"""
+
+    __slots__ = ("user", "assistant", "tokens")
+
+    def __init__(self, user: str, assistant: str):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = estimate_tokens(user) + estimate_tokens(assistant)
+
+
+class Session:
+    """Context and recent turns of one conversation"""
+
+    __slots__ = ("session_id", "department", "level", "faculty", "turns", "last_seen")
+
+    def __init__(self, session_id: str, max_turns: int):
+        self.session_id = session_id
+        self.department: Optional[str] = None
+        self.level: Optional[str] = None
+        self.faculty: Optional[str] = None
+        self.turns: "deque[Turn]" = deque(maxlen=max_turns)
+        self.last_seen = time.time()
+
+    @property
+    def context(self) -> Dict:
+        return {"department": self.department, "level": self.level, "faculty": self.faculty,
+                "conversation": self.turns}
+
+    def to_json(self) -> str:
+        return json.dumps({"department": self.department, "level": self.level, "faculty": self.faculty,
+                           "turns": [(t.user, t.assistant) for t in self.turns]})
+
+    @classmethod
+    def from_json(cls, session_id: str, max_turns: int, data: str) -> "Session":
+        state = json.loads(data)
+        session = cls(session_id, max_turns)
+        session.department, session.level = state["department"], state["level"]
+        session.faculty = state.get("faculty")
+        session.turns.extend(Turn(user, assistant) for user, assistant in state["turns"])
+        return session
+
 
 class MemoryManager:
+    """Per-session conversation memory with bounded size.
+
+    Sessions live in an LRU of at most ``memory_max_sessions`` entries and
+    expire after ``memory_session_ttl`` idle seconds. With ``memory_spill``
+    set, evicted and expired sessions are written to a SQLite file instead of
+    dropped and come back on the session's next message; spilled sessions
+    are purged after ``memory_spill_ttl`` seconds. Calls without a
+    ``session_id`` share the ``"default"`` session.
+
+    ``memory_shared`` makes the spill file the source of truth for processes
+    sharing it (e.g. server workers): every change is written through, and a
+    session is re-read on each access, so any worker can serve any turn.
+    """
+
     def __init__(self, config):
-        self.context = {
-            "department": None,
-            "level": None,
-            "conversation": deque(maxlen=10)
-        }
-    
-    def update_context(self, query: str):
-        """Extract and store contextual clues"""
-        if "computer science" in query:
-            self.context["department"] = "Computer Science"
-        # Add more context extraction rules
-        
-    def build_llm_prompt(self, query: str) -> list:
-        """Convert memory into LLM prompt"""
-        return [
-            {"role": "system", "content": f"You're a Crescent Uni assistant. Current context: {self.context}"},
-            *[{"role": "user", "content": msg["user"]} 
-              for msg in self.context["conversation"]]
-        ]
+        self.config = config
+        self.max_sessions = config["memory_max_sessions"]
+        self.session_ttl = config["memory_session_ttl"]
+        self.max_turns = config["memory_max_turns"]
+        self.prompt_token_budget = config["memory_prompt_tokens"]
+        self.spill_ttl = config["memory_spill_ttl"]
+        self.shared = bool(config["memory_shared"])
+        self.spill_path = None
+        if self.shared or config["memory_spill"]:
+            self.spill_path = Path(config["memory_spill_path"] or
+                                   Path(config["data_path"]) / "sessions.sqlite3")
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = self._connect() if self.spill_path else None
+        self._extractor: Optional[ContextExtractor] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.spill_path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def extractor(self) -> ContextExtractor:
+        """Context extractor for the configured dataset, built on first use"""
+        if self._extractor is None:
+            self._extractor = ContextExtractor.from_config(self.config)
+        return self._extractor
+
+    # --- Session store ---
+
+    def session(self, session_id: Optional[str] = None) -> Session:
+        """The live session for an id, restored from the spill file or created as needed"""
+        session_id = session_id or DEFAULT_SESSION
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None or self.shared:
+                # Shared: another process may have changed it since this one last did
+                session = self._restore(session_id) or session or Session(session_id, self.max_turns)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._evict(self._sessions.popitem(last=False)[1])
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def _expire(self, now: float):
+        # Sessions are in last-use order, so expired ones are all at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen <= self.session_ttl:
+                break
+            self._evict(self._sessions.popitem(last=False)[1])
+
+    def _evict(self, session: Session):
+        """Write a session to the spill file (if it holds anything worth keeping)"""
+        if self._conn is None or not (session.turns or session.department or session.level or session.faculty):
+            return
+        try:
+            self._conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                               (session.session_id, session.to_json(), session.last_seen))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Session spill failed: {e}")
+
+    def _restore(self, session_id: str) -> Optional[Session]:
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute("SELECT state, last_seen FROM sessions WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+            if row is None:
+                return None
+            if not self.shared:  # back in memory; the live copy is the only one
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Session restore failed: {e}")
+            return None
+        if time.time() - row[1] > self.spill_ttl:
+            return None
+        return Session.from_json(session_id, self.max_turns, row[0])
+
+    def end_session(self, session_id: str):
+        """Forget a session, in memory and on disk"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+
+    def purge_spilled(self) -> int:
+        """Delete spilled sessions idle longer than ``memory_spill_ttl``"""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE last_seen < ?",
+                                        (time.time() - self.spill_ttl,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def reopen(self):
+        """Reconnect the spill file in a forked worker; inherited sessions are dropped"""
+        with self._lock:
+            self._sessions.clear()
+            if self.spill_path:
+                self._conn = self._connect()
+
+    def close(self):
+        """Spill every live session (when spilling is enabled)"""
+        with self._lock:
+            if self._conn is None:
+                return
+            for session in self._sessions.values():
+                self._evict(session)
+            self.purge_spilled()
+
+    # --- Conversation ---
+
+    @property
+    def context(self) -> Dict:
+        """Context of the default session"""
+        return self.session().context
+
+    def update_context(self, query: str, session_id: Optional[str] = None,
+                       extractor: Optional[ContextExtractor] = None):
+        """Extract and store contextual clues (department, faculty, level) mentioned in the query"""
+        session = self.session(session_id)
+        found = (extractor or self.extractor).extract(query)
+        for slot, value in found.items():
+            setattr(session, slot, value)
+        if found and self.shared:
+            with self._lock:
+                self._evict(session)
+
+    def add_turn(self, user: str, assistant: str, session_id: Optional[str] = None):
+        session = self.session(session_id)
+        session.turns.append(Turn(user, assistant))
+        if self.shared:
+            with self._lock:
+                self._evict(session)
+
+    def build_llm_prompt(self, query: str, session_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Convert memory into LLM prompt, keeping the newest turns that fit the token budget"""
+        session = self.session(session_id)
+        context = {"department": session.department, "level": session.level, "faculty": session.faculty}
+        system = {"role": "system", "content": f"You're a Crescent Uni assistant. Current context: {context}"}
+        budget = self.prompt_token_budget - estimate_tokens(system["content"]) - estimate_tokens(query)
+
+        history: List[Dict[str, str]] = []
+        for turn in reversed(session.turns):
+            budget -= turn.tokens
+            if budget < 0:
+                break
+            history[:0] = [{"role": "user", "content": turn.user},
+                           {"role": "assistant", "content": turn.assistant}]
+        return [system, *history, {"role": "user", "content": query}]
+
+    def request_clarification(self, session_id: Optional[str] = None) -> str:
+        """Ask the user to narrow down a low-confidence question"""
+        department = self.session(session_id).department
+        if department:
+            return f"Could you give a bit more detail about your {department} question?"
+        return "Could you rephrase that, or tell me your department and level?"
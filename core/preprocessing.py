@@ -1,16 +1,262 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from core.embedding_index import INDEX_DIRNAME
+
+FREQUENCY_DICTIONARY = Path(__file__).parent.parent / "frequency_dictionary_en_82_765.txt"
+_WORD_RE = re.compile(r"[a-z]+")
+_SPACE_RE = re.compile(r"\s+")
+_CACHE_VERSION = 2
+_PREFIX_LENGTH = 7
+
+
+def _osa_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (adjacent transpositions count as one edit); > max_distance if too far"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class _SpellIndex:
+    """SymSpell lookup over the precomputed SQLite word and delete tables.
+
+    The tables are queried straight from disk, so "loading" the index is
+    opening a file rather than unpickling ~700k Python objects. symspellpy
+    is only needed to build them.
+    """
+
+    def __init__(self, path: Path, max_edit_distance: int):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.max_edit_distance = max_edit_distance
+        self._lock = threading.Lock()
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        self.max_length = int(meta["max_length"])
+        self.prefix_length = int(meta["prefix_length"])
+
+    def _value(self, table: str, key: str):
+        with self._lock:
+            row = self.conn.execute(f"SELECT value FROM {table} WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, word: str) -> bool:
+        return self._value("words", word) is not None
+
+    def correct(self, term: str) -> str:
+        """Most frequent word at the smallest edit distance (SymSpell's ``Verbosity.TOP``), else ``term``"""
+        if len(term) - self.max_edit_distance > self.max_length or term in self:
+            return term
+        # Every dictionary word is filed under the deletes of its prefix; walk the
+        # term's prefix deletes, fewest deletions first, and score what they lead to
+        prefix = term[:self.prefix_length]
+        best, best_key = term, (self.max_edit_distance + 1, 0)
+        candidates, seen_deletes, seen_words = [prefix], {prefix}, set()
+        for candidate in candidates:  # grows while iterating
+            deleted = len(prefix) - len(candidate)
+            if deleted > best_key[0]:
+                break
+            for word in (self._value("deletes", candidate) or "").split("\t"):
+                if not word or word in seen_words:
+                    continue
+                seen_words.add(word)
+                limit = min(best_key[0], self.max_edit_distance)
+                distance = _osa_distance(term, word, limit)
+                if distance <= limit:
+                    key = (distance, -self._value("words", word))
+                    if key < best_key:
+                        best, best_key = word, key
+            if deleted < min(self.max_edit_distance, best_key[0]):
+                for i in range(len(candidate)):
+                    delete = candidate[:i] + candidate[i + 1:]
+                    if delete not in seen_deletes:
+                        seen_deletes.add(delete)
+                        candidates.append(delete)
+        return best
+
+
 class TextNormalizer:
+    """Single-pass text normalizer: abbreviations, synonyms and spelling.
+
+    Abbreviation and synonym tables are compiled into one regex (longest
+    phrase first) whose callback also spell-corrects unknown words, so each
+    message is scanned once. The SymSpell dictionary is precomputed into a
+    SQLite file that is opened, not loaded, at startup; it is built in a
+    background thread the first time the source files change.
+    """
+
     def __init__(self, config):
-        self.abbreviations = self._load_dynamic_dict(config["abbreviations_path"])
-        self.synonyms = self._load_dynamic_dict(config["synonyms_path"])
-    
-    def normalize(self, text: str) -> str:
-        """Pipeline for text cleaning"""
-        text = text.lower().strip()
-        text = self._correct_spelling(text)
-        text = self._expand_abbreviations(text)
-        text = self._standardize_synonyms(text)
-        return text
-    
-    def is_abusive(self, text: str) -> bool:
-        """Enhanced toxicity check"""
-        return any(bad_word in text for bad_word in self.config["banned_words"])
+        self.config = config
+        data_path = Path(config["data_path"])
+        self.abbreviations_path = Path(config["abbreviations_path"] or data_path / "abbreviations.csv")
+        self.synonyms_path = Path(config["synonyms_path"] or data_path / "synonyms.csv")
+        self.qa_path = data_path / "qa_dataset.json"
+        self.cache_dir = data_path / INDEX_DIRNAME
+        self.max_edit_distance = config["spell_max_edit_distance"]
+
+        self.abbreviations = self._load_dynamic_dict(self.abbreviations_path)
+        self.synonyms = self._load_dynamic_dict(self.synonyms_path)
+        self.replacements = {**self.abbreviations, **self.synonyms}
+        self._pattern = self._compile_pattern(self.replacements)
+
+        self._spell_index: Optional[_SpellIndex] = None
+        self._corrections: Dict[str, str] = {}
+        self._spell_ready = threading.Event()
+        self._spell_builder: Optional[threading.Thread] = None
+        if config["spell_check"]:
+            self._init_spell_index(background=config["spell_check_background"])
+
+    def reopen(self):
+        """Reconnect the spelling index in a forked worker"""
+        if self._spell_index is not None:
+            self._inherited_conn = self._spell_index.conn  # never used or closed here
+            self._open_spell_index(self._index_path())
+
+    def normalize(self, text: str, spell_check: bool = True) -> str:
+        """Pipeline for text cleaning; ``spell_check=False`` only expands abbreviations and synonyms"""
+        text = _SPACE_RE.sub(" ", text.lower()).strip()
+        return self._pattern.sub(self._replace if spell_check else self._expand, text)
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until spelling correction is available; returns at once if it never will be"""
+        if self._spell_builder is None:
+            return self._spell_ready.is_set()
+        self._spell_builder.join(timeout)
+        return self._spell_ready.is_set()
+
+    # --- Compiled tables ---
+
+    @staticmethod
+    def _load_dynamic_dict(path: Path) -> Dict[str, str]:
+        """Two-column CSV (with header row) as a lowercase mapping"""
+        if not path.exists():
+            return {}
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        return {
+            row[0].strip().lower(): row[1].strip().lower()
+            for row in rows[1:]
+            if len(row) >= 2 and row[0].strip()
+        }
+
+    @staticmethod
+    def _compile_pattern(replacements: Dict[str, str]) -> re.Pattern:
+        # Longest phrases first so "credit unit" wins over "credit". Only whole tokens
+        # match: not the "d" of "i'd" or "r&d", the "csc" of "csc201" or the "nd" of "22nd"
+        phrases = sorted(replacements, key=len, reverse=True)
+        alternation = "".join(f"{re.escape(phrase)}|" for phrase in phrases)
+        return re.compile(rf"(?<![\w'&-])(?:{alternation}[a-z]+)(?![\w'&-])")
+
+    def _replace(self, match: re.Match) -> str:
+        token = match.group(0)
+        replacement = self.replacements.get(token)
+        if replacement is not None:
+            return replacement
+        return self._correct_spelling(token)
+
+    def _expand(self, match: re.Match) -> str:
+        token = match.group(0)
+        return self.replacements.get(token, token)
+
+    def _correct_spelling(self, token: str) -> str:
+        if len(token) < 4 or not self._spell_ready.is_set():
+            return token
+        corrected = self._corrections.get(token)
+        if corrected is None:
+            corrected = self._spell_index.correct(token)
+            if len(self._corrections) < 10000:
+                self._corrections[token] = corrected
+        return corrected
+
+    # --- Precomputed SymSpell index ---
+
+    def _index_path(self) -> Path:
+        digest = hashlib.sha256(f"v{_CACHE_VERSION}:{self.max_edit_distance}".encode())
+        for path in (FREQUENCY_DICTIONARY, self.qa_path):
+            if path.exists():
+                stat = path.stat()
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return self.cache_dir / f"symspell-{digest.hexdigest()[:16]}.sqlite3"
+
+    def _init_spell_index(self, background: bool):
+        path = self._index_path()
+        if path.exists():
+            self._open_spell_index(path)
+            return
+        try:
+            import symspellpy  # noqa: F401  (only needed to build the index)
+        except ImportError:
+            return
+        if background:
+            self._spell_builder = threading.Thread(target=self._build_spell_index, args=(path,), daemon=True)
+            self._spell_builder.start()
+        else:
+            self._build_spell_index(path)
+
+    def _open_spell_index(self, path: Path):
+        self._spell_index = _SpellIndex(path, self.max_edit_distance)
+        self._spell_ready.set()
+
+    def _domain_words(self) -> Dict[str, int]:
+        """Words from the QA questions, so course names and acronyms aren't 'corrected'"""
+        if not self.qa_path.exists():
+            return {}
+        with open(self.qa_path, encoding="utf-8") as f:
+            qa_data = json.load(f)
+        words = {}
+        for qa in qa_data:
+            for word in _WORD_RE.findall(qa["question"].lower()):
+                words[word] = words.get(word, 0) + 1
+        return words
+
+    def _build_spell_index(self, path: Path):
+        """Compute SymSpell's word and delete tables once and write them to SQLite"""
+        from symspellpy import SymSpell
+
+        sym_spell = SymSpell(max_dictionary_edit_distance=self.max_edit_distance, prefix_length=_PREFIX_LENGTH)
+        sym_spell.load_dictionary(FREQUENCY_DICTIONARY, 0, 1, encoding="utf-8-sig")
+        # Domain words get the top count so they win ties against general English
+        top_count = max(sym_spell.words.values(), default=1)
+        for word in self._domain_words():
+            sym_spell.create_dictionary_entry(word, top_count)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        conn = sqlite3.connect(str(tmp))
+        with conn:
+            conn.execute("CREATE TABLE words (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID")
+            conn.execute("CREATE TABLE deletes (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany("INSERT INTO words VALUES (?, ?)", sym_spell.words.items())
+            conn.executemany("INSERT INTO deletes VALUES (?, ?)",
+                             ((k, "\t".join(v)) for k, v in sym_spell.deletes.items()))
+            conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                             [("max_length", max(map(len, sym_spell.words), default=0)),
+                              ("prefix_length", _PREFIX_LENGTH)])
+        conn.close()
+        os.replace(tmp, path)
+
+        # Drop indexes built from older versions of the source files
+        for stale in self.cache_dir.glob("symspell-*.sqlite3"):
+            if stale != path:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+        self._open_spell_index(path)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """LRU cache of generated answers, looked up by query-embedding similarity.
+
+    Keys live in a preallocated float32 matrix, so a lookup is one
+    matrix-vector product over the occupied slots. Entries expire after
+    ``ttl`` seconds, the least recently used slot is evicted when full, and
+    the whole cache is dropped when the knowledge base hash changes. Each
+    entry also records the conversation context it was generated in (e.g.
+    department and level) and only answers lookups made in that same context.
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.95, ttl: float = 3600,
+                 max_entries: int = 1000, dataset_hash: str = "",
+                 path: Optional[Path] = None):
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.dataset_hash = dataset_hash
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._reset()
+        if self.path:
+            self.load()
+
+    def _reset(self):
+        self._keys = np.zeros((self.max_entries, self.dim), dtype=np.float32)
+        self._expires = np.zeros(self.max_entries, dtype=np.float64)  # 0 marks a free slot
+        self._last_used = np.zeros(self.max_entries, dtype=np.int64)
+        self._answers = [None] * self.max_entries
+        self._queries = [None] * self.max_entries
+        self._contexts = [None] * self.max_entries
+        self._context_codes: Dict[Tuple, int] = {}
+        self._context_of = np.full(self.max_entries, -1, dtype=np.int64)
+        self._clock = 0
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires > time.time()))
+
+    def get(self, embedding: np.ndarray, context: Tuple = ()) -> Optional[str]:
+        """Cached answer for a query at least ``threshold``-similar asked in the same context, if still fresh"""
+        with self._lock:
+            code = self._context_codes.get(tuple(context))
+            if code is None:
+                self.misses += 1
+                return None
+            scores = self._keys @ np.asarray(embedding, dtype=np.float32)
+            scores[(self._expires <= time.time()) | (self._context_of != code)] = -np.inf
+            slot = int(scores.argmax())
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._last_used[slot] = self._clock
+            return self._answers[slot]
+
+    def put(self, query: str, embedding: np.ndarray, answer: str, context: Tuple = ()):
+        with self._lock:
+            now = time.time()
+            free = np.flatnonzero(self._expires <= now)
+            slot = int(free[0]) if free.size else int(self._last_used.argmin())
+            self._store(slot, embedding, now + self.ttl, answer, query, tuple(context))
+
+    def _store(self, slot: int, embedding: np.ndarray, expires: float, answer: str, query: str,
+               context: Tuple):
+        self._clock += 1
+        self._keys[slot] = embedding
+        self._expires[slot] = expires
+        self._last_used[slot] = self._clock
+        self._answers[slot] = answer
+        self._queries[slot] = query
+        self._contexts[slot] = context
+        self._context_of[slot] = self._context_codes.setdefault(context, len(self._context_codes))
+
+    def invalidate(self, dataset_hash: Optional[str] = None):
+        """Drop every entry; called when the knowledge base changes"""
+        with self._lock:
+            self._reset()
+            if dataset_hash is not None:
+                self.dataset_hash = dataset_hash
+
+    def invalidate_near(self, embeddings: np.ndarray, threshold: float,
+                        dataset_hash: Optional[str] = None) -> int:
+        """Drop entries whose query is within ``threshold`` of any given embedding.
+
+        Used on a knowledge base edit, so answers cached for questions the
+        dataset now covers differently aren't served; returns the number dropped.
+        """
+        with self._lock:
+            if dataset_hash is not None:
+                self.dataset_hash = dataset_hash
+            embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+            if not embeddings.shape[0]:
+                return 0
+            live = self._expires > time.time()
+            stale = live & ((self._keys @ embeddings.T).max(axis=1) >= threshold)
+            for slot in np.flatnonzero(stale):
+                self._expires[slot] = 0
+                self._answers[slot] = self._queries[slot] = self._contexts[slot] = None
+            return int(stale.sum())
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+    def save(self):
+        """Write live entries to ``path`` (keys as .npy, answers as JSON)"""
+        if not self.path:
+            return
+        with self._lock:
+            live = np.flatnonzero(self._expires > time.time())
+            meta = {
+                "dataset_hash": self.dataset_hash,
+                "entries": [
+                    {"query": self._queries[i], "answer": self._answers[i],
+                     "context": list(self._contexts[i]), "expires": float(self._expires[i])}
+                    for i in live
+                ],
+            }
+            keys = self._keys[live]
+        # Several worker processes may save at once; the digest pairs the two files
+        meta["keys_digest"] = hashlib.sha1(keys.tobytes()).hexdigest()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        keys_tmp = self.path.with_suffix(f".{os.getpid()}.npy")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        np.save(keys_tmp, keys)
+        os.replace(keys_tmp, self.path.with_suffix(".npy"))
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """Restore entries saved for the same knowledge base; stale files are ignored"""
+        keys_path = self.path.with_suffix(".npy")
+        if not (self.path.exists() and keys_path.exists()):
+            return
+        try:
+            with open(self.path) as f:
+                meta = json.load(f)
+            keys = np.load(keys_path)
+        except (OSError, ValueError):
+            return
+        entries = meta.get("entries", [])
+        if meta.get("dataset_hash") != self.dataset_hash or len(entries) != len(keys):
+            return
+        digest = meta.get("keys_digest")
+        if digest and digest != hashlib.sha1(keys.tobytes()).hexdigest():
+            return  # json and .npy come from different saves
+
+        now = time.time()
+        with self._lock:
+            for key, entry in zip(keys[-self.max_entries:], entries[-self.max_entries:]):
+                if entry["expires"] <= now or key.shape != (self.dim,):
+                    continue
+                slot = int(np.flatnonzero(self._expires <= now)[0])
+                self._store(slot, key, entry["expires"], entry["answer"], entry["query"],
+                            tuple(entry.get("context", ())))
@@ -0,0 +1,145 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.knowledge_base import KnowledgeBase
+from core.lexical_index import LexicalIndex
+from core.vector_index import VectorIndex, inner_products
+
+
+class RetrievalResult(NamedTuple):
+    row: int
+    score: float
+    stage: str  # "exact", "lexical", "rerank" or "dense"
+
+
+class RetrievalPipeline:
+    """Staged retrieval: metadata pre-filter, BM25 top-N, embedding re-rank.
+
+    Only the lexical candidates are scored against their embedding rows. With
+    ``dense_fallback`` set, the full vector index is also searched when no
+    candidate clears the similarity threshold. That search catches paraphrases
+    sharing no words with their question, but costs a full vector search on
+    every query headed for the LLM, so with the exact backend it is off by
+    default. With ``vector_backend="ivf"`` that search only probes a few
+    lists, so it defaults to on.
+    """
+
+    def __init__(self, qa_data: Sequence[Dict[str, str]], lexical: LexicalIndex,
+                 vector_index: VectorIndex, config):
+        self.kb = qa_data if isinstance(qa_data, KnowledgeBase) else KnowledgeBase(qa_data)
+        self.lexical = lexical
+        self.vector_index = vector_index
+        self.matrix = vector_index.matrix
+        self.lexical_threshold = config["lexical_threshold"]
+        self.similarity_threshold = config["similarity_threshold"]
+        self.num_candidates = config["rerank_candidates"]
+        self.dense_fallback = config["dense_fallback"]
+        if self.dense_fallback is None:
+            self.dense_fallback = config["vector_backend"] == "ivf"
+
+    def filter_mask(self, department: Optional[str] = None, level: Optional[str] = None,
+                    faculty: Optional[str] = None) -> Optional[np.ndarray]:
+        """Rows compatible with the known context; general (unset) rows always pass"""
+        return self.kb.mask(department, level, faculty=faculty)
+
+    def lexical_stage(self, query: str, mask: Optional[np.ndarray] = None
+                      ) -> Tuple[Optional[RetrievalResult], List[int]]:
+        """Cheap stage: a confident lexical answer, else the BM25 candidate rows"""
+        row = self.lexical.lookup_exact(query)
+        if row is not None:
+            return RetrievalResult(row, 1.0, "exact"), []
+
+        hit = self.lexical.best_match(query, min_ratio=self.lexical_threshold, mask=mask)
+        if hit is None and mask is not None:
+            hit = self.lexical.best_match(query, min_ratio=self.lexical_threshold)
+        if hit:
+            return RetrievalResult(hit[0], hit[1], "lexical"), []
+
+        candidates = self.lexical.search(query, k=self.num_candidates, mask=mask)
+        if not candidates and mask is not None:
+            candidates = self.lexical.search(query, k=self.num_candidates)
+        return None, [row for row, _ in candidates]
+
+    def _rerank(self, query_embed: np.ndarray,
+                candidates: List[int]) -> Optional[RetrievalResult]:
+        if not candidates:
+            return None
+        rows = np.sort(np.asarray(candidates, dtype=np.int64))
+        scores = inner_products(self.matrix[rows], query_embed)
+        top = int(scores.argmax())
+        return RetrievalResult(int(rows[top]), float(scores[top]), "rerank")
+
+    @staticmethod
+    def _pick_dense(ids: np.ndarray, scores: np.ndarray, mask: Optional[np.ndarray],
+                    best: Optional[RetrievalResult]) -> Optional[RetrievalResult]:
+        """Best full-index hit passing the mask (else the overall best), if it beats ``best``"""
+        if not len(ids):
+            return best
+        row, score = ids[0], scores[0]
+        if mask is not None:
+            for candidate, candidate_score in zip(ids, scores):
+                if mask[candidate]:
+                    row, score = candidate, candidate_score
+                    break
+        if best is None or score > best.score:
+            return RetrievalResult(int(row), float(score), "dense")
+        return best
+
+    def dense_stage(self, query_embed: np.ndarray, candidates: List[int],
+                    mask: Optional[np.ndarray] = None) -> Optional[RetrievalResult]:
+        """Re-rank candidates by cosine similarity, then the full index if ``dense_fallback`` is set"""
+        best = self._rerank(query_embed, candidates)
+        if self.confident(best) or not self.dense_fallback:
+            return best
+        ids, scores = self.vector_index.search(query_embed, k=10)
+        return self._pick_dense(ids, scores, mask, best)
+
+    def confident(self, result: Optional[RetrievalResult]) -> bool:
+        """Whether a result is good enough to answer without the LLM"""
+        if result is None:
+            return False
+        return result.stage in ("exact", "lexical") or result.score > self.similarity_threshold
+
+    def retrieve(self, query: str, embed: Callable[[str], np.ndarray],
+                 department: Optional[str] = None, level: Optional[str] = None,
+                 faculty: Optional[str] = None) -> Optional[RetrievalResult]:
+        """Best matching row; ``embed`` is only called if the lexical stage is inconclusive"""
+        mask = self.filter_mask(department, level, faculty)
+        result, candidates = self.lexical_stage(query, mask)
+        if result:
+            return result
+        return self.dense_stage(embed(query), candidates, mask)
+
+    def retrieve_batch(self, queries: List[str],
+                       embed_batch: Callable[[List[str]], np.ndarray],
+                       contexts: Optional[List[Tuple[Optional[str], ...]]] = None
+                       ) -> List[Optional[RetrievalResult]]:
+        """Batched ``retrieve``: one ``embed_batch`` call and one full-index search for all misses.
+
+        ``contexts`` holds an optional ``(department, level, faculty)`` tuple per query.
+        """
+        contexts = contexts or [()] * len(queries)
+        results: List[Optional[RetrievalResult]] = [None] * len(queries)
+        masks, pending = [], []
+        for i, (query, context) in enumerate(zip(queries, contexts)):
+            mask = self.filter_mask(*context)
+            masks.append(mask)
+            results[i], candidates = self.lexical_stage(query, mask)
+            if results[i] is None:
+                pending.append((i, candidates))
+        if not pending:
+            return results
+
+        embeds = embed_batch([queries[i] for i, _ in pending])
+        fallback = []
+        for (i, candidates), query_embed in zip(pending, embeds):
+            results[i] = self._rerank(query_embed, candidates)
+            if not self.confident(results[i]) and self.dense_fallback:
+                fallback.append((i, query_embed))
+
+        if fallback:
+            hits = self.vector_index.search_batch(np.stack([e for _, e in fallback]), k=10)
+            for (i, _), (ids, scores) in zip(fallback, hits):
+                results[i] = self._pick_dense(ids, scores, masks[i], results[i])
+        return results
@@ -0,0 +1,155 @@
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+import numpy as np
+
+_BLOCK_ROWS = 1024  # upcast blocks stay in cache
+
+
+def inner_products(matrix: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """``matrix @ queries.T`` in float32, for one query (1-d) or several (2-d).
+
+    A float16 matrix is storage only: CPU half-precision matmuls are several
+    times slower and too coarse near the similarity thresholds, so its rows
+    are upcast a block at a time instead.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if matrix.dtype == np.float32:
+        return matrix @ queries.T
+    out = np.empty(matrix.shape[:1] + queries.shape[:-1], dtype=np.float32)
+    for start in range(0, matrix.shape[0], _BLOCK_ROWS):
+        out[start:start + _BLOCK_ROWS] = matrix[start:start + _BLOCK_ROWS].astype(np.float32) @ queries.T
+    return out
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first; equal scores in position order.
+
+    Every position tied with the k-th score is kept before ordering, so which
+    of them make the cut doesn't depend on how numpy partitions.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.flatnonzero(scores >= np.partition(scores, n - k)[n - k]) if k < n else np.arange(n)
+    return part[np.lexsort((part, -scores[part]))[:k]]
+
+
+class VectorIndex(ABC):
+    """Top-k inner-product search over unit-normalized row vectors.
+
+    ``search`` returns ``(row_ids, scores)`` sorted best first; with
+    normalized vectors the scores are cosine similarities.
+    """
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows closest to ``query`` and their scores, best first"""
+
+    def search_batch(self, queries: np.ndarray, k: int = 5):
+        """Search several queries; returns a list of ``(row_ids, scores)``"""
+        return [self.search(query, k) for query in queries]
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force search: one matrix-vector product per query"""
+
+    def search(self, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        scores = inner_products(self.matrix, query)
+        ids = top_k(scores, k)
+        return ids, scores[ids]
+
+    def search_batch(self, queries: np.ndarray, k: int = 5):
+        # One matrix-matrix product for the whole batch
+        scores = inner_products(self.matrix, queries).T
+        results = []
+        for row in scores:
+            ids = top_k(row, k)
+            results.append((ids, row[ids]))
+        return results
+
+
+class IVFIndex(VectorIndex):
+    """Inverted-file index: spherical k-means coarse quantizer over the rows.
+
+    Each query is compared against ``n_lists`` centroids and only the rows in
+    the ``n_probe`` closest lists are scored exactly. Raising ``n_probe``
+    trades latency for recall; ``n_probe == n_lists`` is exact search.
+    """
+
+    def __init__(self, matrix: np.ndarray, n_lists: int = None, n_probe: int = 8,
+                 train_iters: int = 10, seed: int = 0):
+        super().__init__(matrix)
+        n_rows = matrix.shape[0]
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(n_rows)), n_rows))
+        self.n_probe = n_probe
+        self.centroids = self._train(train_iters, seed)
+
+        # Inverted lists stored CSR-style: row ids grouped by list, plus offsets
+        assignments = self._assign(self.matrix)
+        self.list_ids = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        out = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk):
+            block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+            out[start:start + chunk] = (block @ self.centroids.T).argmax(axis=1)
+        return out
+
+    def _train(self, iters: int, seed: int) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        n_rows = self.matrix.shape[0]
+        sample_size = min(n_rows, max(self.n_lists * 64, 10000))
+        sample = np.asarray(
+            self.matrix[np.sort(rng.choice(n_rows, sample_size, replace=False))],
+            dtype=np.float32,
+        )
+        centroids = sample[rng.choice(sample_size, self.n_lists, replace=False)].copy()
+
+        for _ in range(iters):
+            labels = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty lists from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        return centroids
+
+    def search(self, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32)
+        probes = top_k(self.centroids @ query, self.n_probe)
+        candidates = np.concatenate(
+            [self.list_ids[self.offsets[p]:self.offsets[p + 1]] for p in probes]
+        )
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        candidates.sort()  # sequential access into the (possibly mmapped) matrix
+        scores = inner_products(self.matrix[candidates], query)
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+def build_vector_index(matrix: np.ndarray, config) -> VectorIndex:
+    """Construct the search backend selected by ``config["vector_backend"]``"""
+    backend = config["vector_backend"]
+    if backend == "exact":
+        return ExactIndex(matrix)
+    if backend == "ivf":
+        return IVFIndex(
+            matrix,
+            n_lists=config["ivf_lists"],
+            n_probe=config["ivf_probe"],
+        )
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -0,0 +1,140 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+_SQL_CHUNK = 500  # stay under SQLite's bound-parameter limit
+
+
+class EmbeddingStore:
+    """Two-tier embedding cache: bounded in-memory LRU over an append-only SQLite table.
+
+    New entries are buffered and written in batches with ``INSERT OR IGNORE``,
+    so a flush only touches new rows. SQLite in WAL mode lets several
+    Streamlit workers read and append to the same file concurrently.
+    """
+
+    def __init__(self, path: Path, model_name: str, max_entries: int = 10000,
+                 flush_every: int = 32, max_disk_entries: Optional[int] = None):
+        self.path = Path(path)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pending: Dict[str, np.ndarray] = {}
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+        conn.commit()
+        return conn
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _remember(self, text: str, vector: np.ndarray):
+        self._memory[text] = vector
+        self._memory.move_to_end(text)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the given texts, checking memory then disk"""
+        found = {}
+        missing = []
+        with self._lock:
+            for text in texts:
+                vector = self._memory.get(text)
+                if vector is not None:
+                    self._memory.move_to_end(text)
+                    found[text] = vector
+                elif text in self._pending:
+                    found[text] = self._pending[text]
+                else:
+                    missing.append(text)
+
+            for start in range(0, len(missing), _SQL_CHUNK):
+                chunk = missing[start:start + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text, vector FROM embeddings"
+                    f" WHERE model = ? AND text IN ({placeholders})",
+                    [self.model_name, *chunk],
+                ).fetchall()
+                for text, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(text, vector)
+                    found[text] = vector
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        """Add new vectors; they are persisted on the next batched flush"""
+        with self._lock:
+            for text, vector in items:
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(text, vector)
+                self._pending[text] = vector
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """Append buffered entries to disk in a single transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(self.model_name, text, vector.tobytes())
+                    for text, vector in self._pending.items()]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (model, text, vector)"
+                    " VALUES (?, ?, ?)",
+                    rows,
+                )
+                if self.max_disk_entries:
+                    self._prune_disk()
+            self._pending.clear()
+
+    def _prune_disk(self):
+        # Oldest rows have the lowest rowid, since the table is append-only.
+        # The bound is per model: other models sharing the file keep their rows.
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            " SELECT rowid FROM embeddings WHERE model = ? ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.model_name, self.max_disk_entries),
+        )
+
+    def clear(self):
+        """Drop all entries, in memory and on disk"""
+        with self._lock:
+            self._memory.clear()
+            self._pending.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?",
+                                   (self.model_name,))
+
+    def reopen(self):
+        """Fresh connection and lock for a forked worker; SQLite handles must not cross fork()"""
+        self._inherited_conn = self._conn  # never used or closed here: the parent still owns it
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+
+    def close(self):
+        with self._lock:
+            try:
+                self.flush()
+                self._conn.close()
+            except sqlite3.ProgrammingError:
+                pass  # already closed
@@ -1,85 +1,87 @@
-import os
-from sentence_transformers import SentenceTransformer
-import torch
+import atexit
+import numpy as np
 from typing import List, Union
 from pathlib import Path
-import pickle
+from models import registry
+from models.embedding_store import EmbeddingStore
+from models.onnx_backend import model_dir
+from utils.metrics import metrics
 
 class EmbeddingModel:
     def __init__(self, config):
         self.config = config
-        self.model = self._load_model()
-        self.cache_path = Path(config["data_path"]) / "embedding_cache.pkl"
-        self.cache = self._load_cache()
+        self.base_model = config["embedding_model"]
+        self.backend = config["embedding_backend"]
+        self.onnx_quantized = config["onnx_quantized"]
+        # Backends give slightly different vectors, so caches and indexes are keyed per backend
+        self.model_name = self.base_model
+        if self.backend == "onnx":
+            self.model_name += "+onnx-int8" if self.onnx_quantized else "+onnx"
+        self.cache_path = Path(config["data_path"]) / "embedding_cache.sqlite3"
+        self.cache = EmbeddingStore(
+            self.cache_path,
+            model_name=self.model_name,
+            max_entries=config["embedding_cache_size"],
+            flush_every=config["embedding_cache_flush_every"],
+            max_disk_entries=config["embedding_cache_disk_size"],
+        )
+        atexit.register(self.cache.close)
 
-    def _load_model(self) -> SentenceTransformer:
+    @property
+    def model(self):
+        """Shared encoder (SentenceTransformer or ONNX), loaded on first encode of an uncached text"""
+        return self._load_model()
+
+    def _load_model(self):
         """Load embedding model with error handling"""
         try:
-            return SentenceTransformer(self.config["embedding_model"])
+            if self.backend == "onnx":
+                return registry.onnx_encoder(
+                    self.config["onnx_model_dir"] or model_dir(self.config["data_path"], self.base_model),
+                    quantized=self.onnx_quantized,
+                    intra_op_threads=self.config["onnx_threads"],
+                )
+            return registry.sentence_transformer(self.base_model)
         except Exception as e:
             raise RuntimeError(f"Failed to load embedding model: {str(e)}")
 
-    def _load_cache(self) -> dict:
-        """Load embedding cache if exists"""
-        if os.path.exists(self.cache_path):
-            with open(self.cache_path, "rb") as f:
-                return pickle.load(f)
-        return {}
-
-    def _save_cache(self):
-        """Persist embedding cache"""
-        with open(self.cache_path, "wb") as f:
-            pickle.dump(self.cache, f)
-
-    def encode(self, texts: Union[str, List[str]], normalize: bool = True) -> torch.Tensor:
+    def encode(self, texts: Union[str, List[str]], normalize: bool = True) -> np.ndarray:
         """
         Encode text(s) into embeddings with caching
         Args:
             texts: Single text or list of texts
             normalize: Whether to normalize embeddings to unit length
         Returns:
-            Tensor of embeddings (shape: [num_texts, embedding_dim])
+            float32 array of embeddings (shape: [num_texts, embedding_dim]),
+            in the same order as the input
         """
         if isinstance(texts, str):
             texts = [texts]
 
-        # Check cache first
-        uncached_texts = []
-        cached_embeddings = []
-        for text in texts:
-            if text in self.cache:
-                cached_embeddings.append(self.cache[text])
-            else:
-                uncached_texts.append(text)
+        # Check cache first (only normalized vectors are cached)
+        cached = self.cache.get_many(texts) if normalize else {}
+        uncached_texts = list(dict.fromkeys(t for t in texts if t not in cached))
+        metrics.counter("chat_cache_lookups_total", cache="embedding", result="hit").inc(len(texts) - len(uncached_texts))
+        metrics.counter("chat_cache_lookups_total", cache="embedding", result="miss").inc(len(uncached_texts))
 
-        # Encode uncached texts
+        # Encode uncached texts in one batch
         if uncached_texts:
             new_embeddings = self.model.encode(
                 uncached_texts,
-                convert_to_tensor=True,
+                convert_to_numpy=True,
                 normalize_embeddings=normalize
-            )
-            
-            # Update cache
-            for text, emb in zip(uncached_texts, new_embeddings):
-                self.cache[text] = emb.cpu()  # Store on CPU to save GPU memory
-            self._save_cache()
+            ).astype(np.float32, copy=False)
+            new = dict(zip(uncached_texts, new_embeddings))
+            if normalize:
+                self.cache.put_many(new.items())
+            cached.update(new)
 
-            # Combine results
-            if cached_embeddings:
-                all_embeddings = torch.vstack([
-                    torch.stack(cached_embeddings),
-                    new_embeddings
-                ])
-            else:
-                all_embeddings = new_embeddings
-        else:
-            all_embeddings = torch.stack(cached_embeddings)
+        return np.stack([cached[text] for text in texts])
 
-        return all_embeddings
+    def flush_cache(self):
+        """Persist any buffered cache entries"""
+        self.cache.flush()
 
     def clear_cache(self):
         """Clear the embedding cache"""
-        self.cache = {}
-        if os.path.exists(self.cache_path):
-            os.remove(self.cache_path)
+        self.cache.clear()
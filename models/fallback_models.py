@@ -1,15 +1,45 @@
-import random
-from typing import Dict, List
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline
-import torch
+import re
+from threading import Thread
+from typing import Any, Callable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from models import registry
+from utils.metrics import metrics
+from utils.text_match import trie_pattern
+
+LOCAL_LLM = "microsoft/Phi-3-mini-4k-instruct"
+
+FALLBACK_CATEGORIES = {  # checked in this order
+    "admission": ("admission", "apply", "requirement", "jamb"),
+    "fees": ("fee", "tuition", "payment", "school fee"),
+    "accommodation": ("hostel", "housing", "residence", "accommodation"),
+}
+# Compiled once: keyword -> (rank, category), and one regex finding any keyword at a word start
+_KEYWORDS = {kw: (rank, category) for rank, (category, kws) in enumerate(FALLBACK_CATEGORIES.items())
+             for kw in kws}
+_KEYWORD_RE = re.compile(rf"\b(?:{trie_pattern(_KEYWORDS)})")
+
+
+class FallbackAnswer(NamedTuple):
+    """The tier that answered, its score (the cosine for "semantic", else 0) and the answer text as it streams"""
+    tier: str  # "category", "semantic", "local_llm" or "default"
+    score: float
+    chunks: Iterator[str]
+
 
 class FallbackGenerator:
     def __init__(self, config):
         self.config = config
-        self.small_llm = None
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
-        self.init_models()
+        self._small_llm = None
+        self._llm_failed = False
+        # Defaults to the retriever's bar: the fallback must not answer from a match retrieval rejected
+        self.similarity_threshold = config["fallback_similarity_threshold"]
+        if self.similarity_threshold is None:
+            self.similarity_threshold = config["similarity_threshold"]
+        self.search_k = config["fallback_search_k"]
+        self._snapshot: Optional[Callable[[], Any]] = None
+        self._embed: Optional[Callable] = None
         
         # Predefined responses for common questions
         self.fallback_responses = {
@@ -19,67 +49,135 @@ class FallbackGenerator:
             "default": "I'm having trouble accessing detailed information. Please contact admissions@crescent.edu.ng for specific queries."
         }
 
+    def attach_index(self, snapshot: Callable[[], Any], embed: Callable):
+        """Answer from the engine's knowledge base instead of a second encoder.
+
+        ``snapshot()`` returns the current state (``kb``, ``vector_index`` and
+        ``retriever``) and ``embed`` is the engine's cached encoder.
+        """
+        self._snapshot, self._embed = snapshot, embed
+
+    @property
+    def small_llm(self):
+        """Local LLM, loaded on first use; None if it can't be loaded"""
+        if self._small_llm is None and not self._llm_failed:
+            self.init_models()
+        return self._small_llm
+
     def init_models(self):
         """Initialize smaller local models"""
         try:
             # Tiny LLM for basic generation (only loads when needed)
-            self.small_llm = pipeline(
+            self._small_llm = registry.hf_pipeline(
                 "text-generation",
-                model="microsoft/Phi-3-mini-4k-instruct",
-                torch_dtype=torch.float16,
+                LOCAL_LLM,
+                torch_dtype="float16",
                 device_map="auto"
             )
         except Exception as e:
+            self._llm_failed = True  # don't retry a multi-GB load on every query
             print(f"Couldn't load local LLM: {e}")
 
-    def generate(self, query: str) -> str:
-        """Multi-stage fallback response generation"""
+    def warm_up(self):
+        """Load the local LLM in the background"""
+        return registry.warm_up(self.init_models)
+
+    def generate(self, query: str, query_embed: Optional[np.ndarray] = None,
+                 context: Tuple[Optional[str], ...] = ()) -> Tuple[str, str, float]:
+        """Multi-stage fallback response generation; returns (text, tier, score)"""
+        answer = self.stream(query, query_embed, context)
+        return "".join(answer.chunks).strip(), answer.tier, answer.score
+
+    def stream(self, query: str, query_embed: Optional[np.ndarray] = None,
+               context: Tuple[Optional[str], ...] = ()) -> FallbackAnswer:
+        """First tier that can answer; local LLM tokens stream as they are produced.
+
+        ``context`` is the (department, level, faculty) the retriever filtered by.
+        """
         # Stage 1: Check if question matches known categories
-        category_response = self._match_category(query)
-        if category_response:
-            return category_response
-        
-        # Stage 2: Use local LLM if available
-        if self.small_llm:
-            return self._local_llm_response(query)
-        
-        # Stage 3: Semantic fallback to closest known question
-        return self._semantic_fallback(query)
-
-    def _match_category(self, query: str) -> str:
-        """Match against predefined categories"""
-        query_lower = query.lower()
-        categories = {
-            "admission": ["admission", "apply", "requirement", "jamb"],
-            "fees": ["fee", "tuition", "payment", "school fee"],
-            "accommodation": ["hostel", "housing", "residence", "accommodation"]
-        }
-        
-        for category, keywords in categories.items():
-            if any(kw in query_lower for kw in keywords):
-                return self.fallback_responses[category]
+        response = self._match_category(query)
+        if response:
+            answer = FallbackAnswer("category", 0.0, iter([response]))
+        # Stage 2: Closest known question in the same context, one lookup in the engine's index
+        elif (match := self._semantic_fallback(query, query_embed, context)) is not None:
+            answer = FallbackAnswer("semantic", match[1], iter([match[0]]))
+        # Stage 3: Use local LLM if available
+        elif self.small_llm:
+            answer = FallbackAnswer("local_llm", 0.0, self._stream_local_llm(query))
+        else:
+            answer = FallbackAnswer("default", 0.0, iter([self.fallback_responses["default"]]))
+        metrics.counter("fallback_answers_total", tier=answer.tier).inc()
+        return answer
+
+    def _match_category(self, query: str) -> Optional[str]:
+        """Match against predefined categories; the earliest category wins, as listed"""
+        matches = [_KEYWORDS[m.group(0)] for m in _KEYWORD_RE.finditer(query.lower())]
+        if not matches:
+            return None
+        return self.fallback_responses[min(matches)[1]]
+
+    def nearest_answer(self, query: str, query_embed: Optional[np.ndarray] = None,
+                       context: Tuple[Optional[str], ...] = ()) -> Optional[Tuple[str, float]]:
+        """Answer of the closest knowledge-base question compatible with ``context`` and its cosine score.
+
+        None if no index is attached or none of the ``search_k`` nearest rows passes the context mask.
+        """
+        if self._snapshot is None:
+            return None
+        state = self._snapshot()
+        if query_embed is None:
+            query_embed = self._embed(query)[0]
+        mask = state.retriever.filter_mask(*context)
+        ids, scores = state.vector_index.search(query_embed, k=1 if mask is None else self.search_k)
+        for row, score in zip(ids, scores):
+            if mask is None or mask[row]:
+                return state.kb.answers[int(row)], float(score)
         return None
 
-    def _local_llm_response(self, query: str) -> str:
-        """Generate response using local LLM"""
+    def _stream_local_llm(self, query: str) -> Iterator[str]:
+        """Stream local LLM output; generation runs in a thread feeding a TextIteratorStreamer"""
+        from transformers import TextIteratorStreamer
+
         prompt = f"""You are Crescent University's assistant. Provide a concise answer to this student query:
         
         Query: {query}
         Answer: """
         
+        streamer = TextIteratorStreamer(
+            self.small_llm.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        errors = []
+
+        def run():
+            try:
+                self.small_llm(
+                    prompt,
+                    max_new_tokens=150,
+                    do_sample=True,
+                    temperature=0.7,
+                    streamer=streamer
+                )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        Thread(target=run, daemon=True).start()
+        produced = False
+        for text in streamer:
+            if text:
+                produced = True
+                yield text
+        if errors and not produced:
+            yield self.fallback_responses["default"]
+
+    def _semantic_fallback(self, query: str, query_embed: Optional[np.ndarray] = None,
+                           context: Tuple[Optional[str], ...] = ()) -> Optional[Tuple[str, float]]:
+        """Closest matching question from the knowledge base and its score, if it clears the retriever's bar"""
         try:
-            response = self.small_llm(
-                prompt,
-                max_new_tokens=150,
-                do_sample=True,
-                temperature=0.7
-            )[0]['generated_text']
-            return response.split("Answer: ")[-1].strip()
-        except Exception:
-            return self._semantic_fallback(query)
-
-    def _semantic_fallback(self, query: str) -> str:
-        """Find the closest matching question from knowledge base"""
-        # Implement semantic search similar to main engine
-        # (using the local embedder)
-        return self.fallback_responses["default"]
+            match = self.nearest_answer(query, query_embed, context)
+        except Exception as e:
+            print(f"Semantic fallback failed: {e}")
+            return None
+        if match is None or match[1] <= self.similarity_threshold:  # same test as RetrievalPipeline.confident
+            return None
+        return match
@@ -0,0 +1,213 @@
+"""ONNX Runtime inference backend for sentence embeddings on CPU-only nodes.
+
+Export once (needs torch + sentence-transformers), then serve with only
+``onnxruntime`` and ``tokenizers``:
+
+    python -m models.onnx_backend --model all-MiniLM-L6-v2
+
+This writes ``model.onnx``, a dynamically int8-quantized
+``model.int8.onnx``, the tokenizer and the pooling settings to
+``data/onnx/<model>/``. Select it with ``embedding_backend: "onnx"``.
+
+Every export is checked against the torch embeddings and the command exits
+non-zero if a graph is out of tolerance; ``--check`` re-runs only the check.
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ONNX_DIRNAME = "onnx"
+CONFIG_FILE = "onnx_config.json"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+FP32_ATOL = 1e-4  # the fp32 graph differs from torch by float rounding only
+INT8_MIN_COSINE = 0.98  # int8 weights move embeddings slightly
+PARITY_SENTENCES = (
+    "What are the admission requirements?",
+    "how much is the school fee for 100 level",
+    "hostel",
+    "Who is the HOD of Computer Science and where is the department office located?",
+    "CSC 301 course outline",
+    "Can I change my course after the first semester, and what documents do I need to submit "
+    "to the faculty officer before the deadline?",
+)
+
+
+def model_dir(data_path: Path, model_name: str) -> Path:
+    """Export directory for a model under the data directory"""
+    return Path(data_path) / ONNX_DIRNAME / re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+
+class OnnxEncoder:
+    """Drop-in for ``SentenceTransformer.encode`` backed by an exported ONNX graph.
+
+    The graph returns token embeddings; pooling and normalization happen in
+    numpy using the settings recorded at export time.
+    """
+
+    def __init__(self, export_dir: Path, quantized: bool = True,
+                 intra_op_threads: int = 0, batch_size: int = 32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        export_dir = Path(export_dir)
+        self.model_path = export_dir / (INT8_FILE if quantized else FP32_FILE)
+        if not self.model_path.exists():
+            raise FileNotFoundError(
+                f"{self.model_path} not found; run `python -m models.onnx_backend` to export it")
+        with open(export_dir / CONFIG_FILE) as f:
+            self.settings: Dict = json.load(f)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(str(export_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.settings["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.settings["pad_token_id"],
+                                      pad_token=self.settings["pad_token"])
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads  # 0 lets ORT use every core
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(self.model_path), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.settings["dim"]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+        tokens = self.session.run(None, feeds)[0]
+
+        if self.settings["pooling"] == "cls":
+            return tokens[:, 0]
+        mask = feeds["attention_mask"][..., None].astype(tokens.dtype)
+        return (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, texts: List[str], convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **_) -> np.ndarray:
+        """Embed texts, longest first so each batch pads to a similar length"""
+        if isinstance(texts, str):
+            texts = [texts]
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        out = np.empty((len(texts), self.settings["dim"]), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            out[rows] = self._embed_batch([texts[i] for i in rows])
+        if normalize_embeddings or self.settings.get("normalize"):
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def parity_failures(name: str, reference: np.ndarray, embeds: np.ndarray, quantized: bool,
+                    atol: float = FP32_ATOL, min_cosine: float = INT8_MIN_COSINE) -> List[str]:
+    """How normalized ``embeds`` differ from the torch ``reference`` beyond tolerance; empty if they don't"""
+    if embeds.shape != reference.shape:
+        return [f"{name}: shape {embeds.shape} != torch {reference.shape}"]
+    failures = []
+    cosines = (embeds * reference).sum(axis=1)
+    if cosines.min() < min_cosine:
+        failures.append(f"{name}: min cosine to torch {cosines.min():.4f} < {min_cosine}")
+    if not quantized:
+        difference = float(np.abs(embeds - reference).max())
+        if difference > atol:
+            failures.append(f"{name}: max abs difference to torch {difference:.2e} > {atol:.0e}")
+    return failures
+
+
+def check_parity(model_name: str, export_dir: Path, texts=PARITY_SENTENCES) -> List[str]:
+    """Compare every exported graph with the torch model on ``texts``; returns the failures"""
+    from sentence_transformers import SentenceTransformer
+
+    texts = list(texts)
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    failures = []
+    for filename, quantized in ((FP32_FILE, False), (INT8_FILE, True)):
+        if (Path(export_dir) / filename).exists():
+            embeds = OnnxEncoder(export_dir, quantized=quantized).encode(texts, normalize_embeddings=True)
+            failures += parity_failures(filename, reference, embeds, quantized)
+    return failures
+
+
+def export(model_name: str, out_dir: Path, opset: int = 14, quantize: bool = True) -> Path:
+    """Export a SentenceTransformer's transformer to ONNX and quantize its weights to int8"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    pooling = next((m for m in st if type(m).__name__ == "Pooling"), None)
+    normalize = any(type(m).__name__ == "Normalize" for m in st)
+
+    sample = tokenizer(["an example sentence", "another"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {"batch": 0, "sequence": 1}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            str(out_dir / FP32_FILE),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={**{name: dynamic for name in input_names}, "token_embeddings": dynamic},
+            opset_version=opset,
+        )
+
+    tokenizer.save_pretrained(str(out_dir))
+    with open(out_dir / CONFIG_FILE, "w") as f:
+        json.dump({
+            "model": model_name,
+            "dim": st.get_sentence_embedding_dimension(),
+            "max_seq_length": st.max_seq_length,
+            "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+            "normalize": normalize,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(out_dir / FP32_FILE), str(out_dir / INT8_FILE),
+                         weight_type=QuantType.QInt8)
+    return out_dir
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export an embedding model to ONNX")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--data-dir", type=Path, default=Path(__file__).parent.parent / "data")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--check", action="store_true", help="only check an existing export against torch")
+    args = parser.parse_args(argv)
+
+    out_dir = model_dir(args.data_dir, args.model)
+    if not args.check:
+        export(args.model, out_dir, opset=args.opset, quantize=not args.no_quantize)
+        sizes = ", ".join(f"{p.name} {p.stat().st_size / 1e6:.1f} MB" for p in sorted(out_dir.glob("*.onnx")))
+        print(f"Exported {args.model} to {out_dir} ({sizes})")
+
+    failures = check_parity(args.model, out_dir)
+    if failures:
+        sys.exit("Parity check failed:\n  " + "\n  ".join(failures))
+    print(f"Parity check passed (fp32 within {FP32_ATOL:.0e}, int8 cosine >= {INT8_MIN_COSINE})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Process-wide registry of heavy models.
+
+Models are created on first request and shared by every component that asks
+for the same key, so e.g. the embedding engine and the fallback generator use
+one MiniLM instance. ``torch``/``transformers`` are only imported inside the
+loaders.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+_models: Dict[Hashable, Any] = {}
+_key_locks: Dict[Hashable, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_model(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """Return the model for ``key``, calling ``factory`` once if it isn't loaded yet.
+
+    A failed load raises and is retried on the next call.
+    """
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _key_locks.setdefault(key, threading.Lock())
+    with lock:  # concurrent first calls for one key load it only once
+        model = _models.get(key)
+        if model is None:
+            model = factory()
+            _models[key] = model
+    return model
+
+
+def is_loaded(key: Hashable) -> bool:
+    return key in _models
+
+
+def sentence_transformer(name: str):
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return get_model(("sentence_transformer", name), load)
+
+
+def onnx_encoder(export_dir, quantized: bool = True, intra_op_threads: int = 0):
+    def load():
+        from models.onnx_backend import OnnxEncoder
+        return OnnxEncoder(export_dir, quantized=quantized, intra_op_threads=intra_op_threads)
+    return get_model(("onnx", str(export_dir), quantized, intra_op_threads), load)
+
+
+def hf_pipeline(task: str, model: str, **kwargs):
+    def load():
+        from transformers import pipeline
+        if kwargs.get("torch_dtype") == "float16":
+            import torch
+            kwargs["torch_dtype"] = torch.float16
+        return pipeline(task, model=model, **kwargs)
+    key = ("pipeline", task, model, tuple(sorted(kwargs.items())))
+    return get_model(key, load)
+
+
+def warm_up(*loaders: Callable[[], Any]) -> threading.Thread:
+    """Run loaders in a daemon thread so the first real request finds models ready"""
+    def run():
+        for loader in loaders:
+            try:
+                loader()
+            except Exception as e:
+                print(f"Model warm-up failed: {e}")
+
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,278 @@
+"""Standalone pre-fork HTTP server around ``ChatEngine``.
+
+The parent builds one engine (QA data, lexical index, memory-mapped
+embedding index, vector index, spelling index), binds the listening socket
+and forks ``--workers`` children that all accept on it. Everything the
+parent loaded is shared copy-on-write; the ``.npy`` embedding matrix is
+mmap'd, so its pages live in the page cache once for every worker. Models
+still load once per worker, after the fork (torch and CUDA state must not
+be forked): on the first request that needs them, or at worker start with
+``preload_models``.
+
+    python server.py --workers 4 --port 8765
+    CHAT_SERVER_URL=http://127.0.0.1:8765 streamlit run app.py
+
+Endpoints:
+    POST /chat          {"message": "..."}        -> {"response": "..."}
+    POST /chat/batch    {"messages": ["...", ...]} -> {"responses": [...]}
+    POST /chat/stream   {"message": "..."}        -> chunked text/plain
+    Each body may carry "session_id" (batch: "session_ids", one per message)
+    to keep that conversation's memory separate.
+    GET  /health, GET /metrics (Prometheus text, per worker)
+
+``chat_response_seconds{endpoint}`` records each POST from reading the body
+to its last byte out, streaming included. With ``"log_conversations": true``
+in the ``--config`` file, each worker also logs every exchange (and that
+latency) through its own ``ChatLogger`` to ``<data_dir>/logs``.
+
+Each worker handles one request at a time; scale with ``--workers``. Any
+worker may serve any turn of a conversation, so with more than one worker
+``memory_shared`` defaults to on: session memory is written through to the
+spill file and re-read on every request.
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Dict
+
+from utils.config import config, load_settings_file
+from utils.logger import ChatLogger
+
+
+def load_config(path: Path = None):
+    """App settings, with overrides from an optional JSON file; unknown names raise ``ValueError``"""
+    if not path:
+        return config
+    return config.replace(**load_settings_file(path))
+
+
+ENDPOINTS = ("/chat", "/chat/batch", "/chat/stream")
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive and chunked streaming
+
+    @property
+    def engine(self):
+        return self.server.engine
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self._headers_sent = True
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "pid": os.getpid()})
+        elif self.path == "/metrics":
+            body = self.engine.metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        self._headers_sent = False  # one handler serves every request on a keep-alive connection
+        start = time.perf_counter()
+        try:
+            self._handle_post(start)
+        finally:
+            endpoint = self.path if self.path in ENDPOINTS else "other"
+            self.engine.metrics.histogram("chat_response_seconds", endpoint=endpoint).observe(
+                time.perf_counter() - start)
+
+    def _log(self, messages, responses, session_ids, start: float):
+        """Log each exchange with the request's latency so far, if this worker logs conversations"""
+        if self.server.chat_log is not None:
+            elapsed = time.perf_counter() - start
+            for message, response, session_id in zip(messages, responses, session_ids):
+                self.server.chat_log.log_conversation(message, response, elapsed, session_id)
+
+    def _handle_post(self, start: float):
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        try:
+            session_id = payload.get("session_id")
+            if self.path == "/chat" and isinstance(payload.get("message"), str):
+                response = self.engine.process_query(payload["message"], session_id)
+                self._send_json(200, {"response": response})
+                self._log([payload["message"]], [response], [session_id], start)
+            elif self.path == "/chat/batch" and isinstance(payload.get("messages"), list):
+                session_ids = payload.get("session_ids") or [session_id] * len(payload["messages"])
+                responses = self.engine.process_queries(payload["messages"], session_ids)
+                self._send_json(200, {"responses": responses})
+                self._log(payload["messages"], responses, session_ids, start)
+            elif self.path == "/chat/stream" and isinstance(payload.get("message"), str):
+                self._log([payload["message"]], [self._stream(payload["message"], session_id)], [session_id], start)
+            else:
+                self._send_json(400, {"error": "expected {'message': str} or {'messages': [str]}"})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client went away; nothing left to tell it
+        except Exception as e:
+            print(f"Request failed: {e}")
+            if self._headers_sent:
+                self.close_connection = True  # a second status line would corrupt the response
+            else:
+                self._send_json(500, {"error": "internal error"})
+
+    def _stream(self, message: str, session_id=None) -> str:
+        """Send the reply as chunks; returns the text that went out"""
+        chunks = self.engine.stream_query(message, session_id)
+        first = next(chunks, "")  # errors before any output still get a 500
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._headers_sent = True
+        sent = []
+        try:
+            self._write_chunk(first)
+            sent.append(first)
+            for chunk in chunks:
+                self._write_chunk(chunk)
+                sent.append(chunk)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client stopped reading
+        except Exception as e:
+            # Headers are out: drop the connection without the terminating chunk,
+            # so the client sees a truncated response rather than a complete one
+            print(f"Stream failed: {e}")
+            self.close_connection = True
+        return "".join(sent).strip()
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        if data:  # a zero-length chunk would end the response
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+class ChatHTTPServer(HTTPServer):
+    request_queue_size = 128
+
+    def __init__(self, address, engine):
+        self.engine = engine
+        self.chat_log = None  # set per worker
+        super().__init__(address, ChatHandler)
+
+
+def _raise_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def _run_worker(server: ChatHTTPServer):
+    """Worker body; never returns into the parent's code"""
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, _raise_exit)
+        signal.signal(signal.SIGINT, _raise_exit)
+        server.engine.after_fork()
+        if server.engine.config["log_conversations"]:
+            server.chat_log = ChatLogger(Path(server.engine.config["data_dir"]) / "logs")
+        server.serve_forever()
+    except SystemExit:
+        pass
+    except Exception as e:
+        print(f"Worker {os.getpid()} crashed: {e}")
+        code = 1
+    finally:
+        try:
+            server.engine.close()
+            if server.chat_log is not None:
+                server.chat_log.close(timeout=5.0)  # os._exit skips the writer's atexit hook
+        finally:
+            os._exit(code)
+
+
+def serve(engine, host: str, port: int, workers: int):
+    """Bind once, fork ``workers`` children and respawn any that die until stopped"""
+    server = ChatHTTPServer((host, port), engine)
+    # Objects loaded so far are never freed; keeping them out of the cyclic GC
+    # stops collections in the workers from touching (and so copying) their pages
+    gc.freeze()
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server)
+        children.add(pid)
+
+    signal.signal(signal.SIGTERM, _raise_exit)
+    print(f"Serving on http://{host}:{server.server_address[1]} with {workers} workers")
+    try:
+        for _ in range(workers):
+            spawn()
+        while True:
+            pid, status = os.wait()
+            children.discard(pid)
+            print(f"Worker {pid} exited with status {status}; restarting")
+            time.sleep(0.5)  # don't spin if workers crash on start
+            spawn()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve ChatEngine over HTTP with a pre-fork worker pool")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--config", type=Path, help="JSON file of engine settings")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("server.py needs fork(); run it on Linux or macOS")
+
+    from core.chat_engine import ChatEngine
+
+    start = time.perf_counter()
+    try:
+        settings = load_config(args.config)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.workers > 1 and settings.memory_shared is None:
+        settings = settings.replace(memory_shared=True)
+    engine = ChatEngine(settings, preload=False)  # workers preload after the fork
+    engine.normalizer.wait_until_ready()  # finish any background index build before forking
+    print(f"Engine ready in {time.perf_counter() - start:.2f}s "
+          f"({len(engine.qa_data)} QA pairs, {engine.index.dim}-d index)")
+    serve(engine, args.host, args.port, max(1, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import pytest
+
+from core.context_extractor import ContextExtractor
+
+
+@pytest.fixture
+def extractor():
+    return ContextExtractor({"pharmacy": "Pharmacy"}, {}, [100, 200, 300, 400, 500])
+
+
+@pytest.mark.parametrize("text, level", [
+    ("i am a third year student", "300"),
+    ("5th year pharmacy courses", "500"),
+    ("courses for year one", "100"),
+    ("year 2 timetable", "200"),
+    ("300 level courses", "300"),
+    ("level 400 courses", "400"),
+])
+def test_level_mentions(extractor, text, level):
+    assert extractor.extract(text)["level"] == level
+
+
+@pytest.mark.parametrize("text", [
+    "is pharmacy a five year programme",
+    "is it a four year degree",
+    "is there a one year diploma",
+    "a 3 year course",
+    "5 years of study",
+])
+def test_durations_are_not_levels(extractor, text):
+    assert "level" not in extractor.extract(text)
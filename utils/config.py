@@ -1,76 +1,427 @@
-from pathlib import Path
-import os
+"""Application settings.
+
+``config`` is built once per process and is immutable. Scalar settings are
+plain typed fields; the data sections (abbreviations, synonyms, QA data,
+device) load on first access and are memoized until their source file's
+mtime or size changes. Heavy libraries (torch, streamlit) are only imported
+when something actually needs them.
+
+It is also a read-only mapping, so components read ``config["data_dir"]``,
+and ``config.replace(...)`` returns a validated copy with overrides. See
+``ConfigManager`` for the settings file and environment variables.
+"""
 import json
-import torch
-from dotenv import load_dotenv
-from typing import Dict, Any, List
-import streamlit as st
+import os
+import pickle
+import sys
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, fields, replace
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple, Union, get_args, get_origin
 
-class ConfigManager:
-    """Robust configuration manager with JSON validation"""
-    
-    def __init__(self):
-        load_dotenv()
-        self.base_dir = Path(__file__).parent.parent
-        self._validate_paths()
-        
-    @property
-    def settings(self) -> Dict[str, Any]:
-        return {
-            "data_dir": self.base_dir / "data",
-            "abbreviations": self._load_abbreviations(),
-            "synonyms": self._load_synonyms(),
-            "qa_data": self._load_qa_data(),
-            "device": self._detect_device()
-        }
-    
-    def _detect_device(self) -> str:
-        return "cuda" if torch.cuda.is_available() else "cpu"
-    
-    def _validate_paths(self) -> None:
-        (self.base_dir / "data").mkdir(exist_ok=True)
-    
-    def _load_abbreviations(self) -> Dict[str, str]:
-        default = {"u": "you", "r": "are"}
-        path = self.base_dir / "data" / "abbreviations.csv"
-        try:
-            if path.exists():
-                with open(path) as f:
-                    return dict(line.strip().split(",", 1) for line in f if line.strip())
-            return default
-        except Exception as e:
-            st.warning(f"Abbreviations load failed: {e}")
-            return default
-    
-    def _load_synonyms(self) -> Dict[str, str]:
-        default = {"hod": "head of department"}
-        path = self.base_dir / "data" / "synonyms.csv"
+BASE_DIR = Path(__file__).parent.parent
+_BINARY_DIRNAME = "index"  # same directory as core.embedding_index.INDEX_DIRNAME
+_BINARY_VERSION = 1
+_CATEGORICAL_FIELDS = ("topic", "department", "faculty", "level")
+
+
+def _report(level: str, message: str):
+    """Print, and surface in the UI when running under Streamlit"""
+    print(message)
+    st = sys.modules.get("streamlit")
+    if st is not None:
         try:
-            if path.exists():
-                with open(path) as f:
-                    return dict(line.strip().split(",", 1) for line in f if line.strip())
-            return default
-        except Exception as e:
-            st.warning(f"Synonyms load failed: {e}")
-            return default
-    
-    def _load_qa_data(self) -> List[Dict[str, str]]:
-        path = self.base_dir / "data" / "qa_dataset.json"
+            getattr(st, level)(message)
+        except Exception:
+            pass  # not inside a script run
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def validate_qa_data(data: Any) -> List[Dict[str, Any]]:
+    """Keep well-formed records: dicts with non-empty string question and answer"""
+    if not isinstance(data, list):
+        raise ValueError("QA data must be a list of dicts")
+    valid = [qa for qa in data
+             if isinstance(qa, dict)
+             and isinstance(qa.get("question"), str) and qa["question"].strip()
+             and isinstance(qa.get("answer"), str)]
+    if len(valid) != len(data):
+        _report("warning", f"Skipped {len(data) - len(valid)} malformed QA records")
+    return valid
+
+
+def load_qa_dataset(path: Path) -> List[Dict[str, Any]]:
+    """Load a QA JSON file through a pre-parsed binary copy.
+
+    The first load validates the JSON and writes ``index/<name>.qa.pickle``
+    next to it, with repeated categorical values (department, level, ...)
+    interned so they unpickle as shared objects. Later loads read that copy
+    as long as the JSON's mtime and size match, about twice as fast as
+    parsing JSON. Raises OSError/ValueError if the JSON is missing or invalid.
+    """
+    path = Path(path)
+    signature = file_signature(path)
+    if signature is None:
+        raise FileNotFoundError(f"QA dataset missing at {path}")
+    binary = path.parent / _BINARY_DIRNAME / f"{path.stem}.qa.pickle"
+
+    try:
+        with open(binary, "rb") as f:
+            header, data = pickle.load(f)
+        if header == (_BINARY_VERSION, signature):
+            return data
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        pass
+
+    with open(path, encoding="utf-8") as f:
+        data = validate_qa_data(json.load(f))
+    pool: Dict[str, str] = {}
+    for qa in data:
+        for key in _CATEGORICAL_FIELDS:
+            value = qa.get(key)
+            if isinstance(value, str):
+                qa[key] = pool.setdefault(value, value)
+
+    try:
+        binary.parent.mkdir(parents=True, exist_ok=True)
+        tmp = binary.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(((_BINARY_VERSION, signature), data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, binary)
+    except OSError as e:
+        print(f"Could not write QA binary cache: {e}")
+    return data
+
+
+class _FileSection:
+    """A value loaded from one file, reloaded when the file's mtime or size changes"""
+
+    def __init__(self, path: Path, loader: Callable[[Path], Any]):
+        self.path = path
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._signature: Any = object()
+        self._value: Any = None
+
+    def get(self) -> Any:
+        signature = file_signature(self.path)
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    self._value = self.loader(self.path)
+                    self._signature = signature
+        return self._value
+
+
+def _csv_loader(default: Dict[str, str], name: str) -> Callable[[Path], Dict[str, str]]:
+    def load(path: Path) -> Dict[str, str]:
         if not path.exists():
-            st.error(f"QA dataset missing at {path}")
-            return []
-        
+            return dict(default)
         try:
-            with open(path) as f:
-                data = json.load(f)
-                if not isinstance(data, list):
-                    raise ValueError("QA data must be a list of dicts")
-                return data
-        except json.JSONDecodeError as e:
-            st.error(f"Invalid JSON in QA file: {e}")
-            return []
+            with open(path, encoding="utf-8") as f:
+                return dict(line.strip().split(",", 1) for line in f if line.strip())
         except Exception as e:
-            st.error(f"QA data load failed: {e}")
-            return []
+            _report("warning", f"{name} load failed: {e}")
+            return dict(default)
+    return load
+
+
+def _qa_loader(path: Path):
+    from core.knowledge_base import KnowledgeBase  # core depends on utils, not the reverse
+
+    try:
+        return KnowledgeBase.from_json(path)
+    except json.JSONDecodeError as e:
+        _report("error", f"Invalid JSON in QA file: {e}")
+    except Exception as e:
+        _report("error", f"QA data load failed: {e}")
+    return KnowledgeBase([])
+
+
+_TRUE, _FALSE = {"1", "true", "yes", "on"}, {"0", "false", "no", "off"}
+_FRACTIONS = ("lexical_threshold", "similarity_threshold", "fallback_similarity_threshold",
+              "toxicity_low_threshold", "toxicity_high_threshold", "toxicity_model_threshold",
+              "response_cache_threshold")
+_AT_LEAST_ONE = ("embedding_cache_size", "embedding_cache_flush_every", "ivf_probe", "rerank_candidates",
+                 "fallback_search_k", "safety_cache_size", "toxicity_batch_size", "llm_max_concurrency",
+                 "llm_breaker_failures", "response_cache_size", "max_batch_size", "memory_max_sessions",
+                 "memory_max_turns", "memory_prompt_tokens")
+
+
+def _coerce(name: str, annotation: Any, value: Any) -> Any:
+    """``value`` as the field's type; strings (from the environment) are parsed"""
+    if get_origin(annotation) is Union:  # Optional[X]
+        if value is None or value == "":
+            return None
+        annotation = next(a for a in get_args(annotation) if a is not type(None))
+    origin = get_origin(annotation)
+    if origin is Literal:
+        if value not in get_args(annotation):
+            raise ValueError(f"Setting {name} must be one of {get_args(annotation)}, got {value!r}")
+        return value
+    if origin is tuple:
+        items = value.split(",") if isinstance(value, str) else value
+        if not isinstance(items, (list, tuple)) or not all(isinstance(i, str) for i in items):
+            raise ValueError(f"Setting {name} must be a list of strings, got {value!r}")
+        return tuple(i.strip() for i in items if i.strip())
+    if annotation is bool:
+        if isinstance(value, str) and value.lower() in _TRUE | _FALSE:
+            return value.lower() in _TRUE
+        if not isinstance(value, bool):
+            raise ValueError(f"Setting {name} must be true or false, got {value!r}")
+        return value
+    if annotation is Path:
+        if not isinstance(value, (str, Path)):
+            raise ValueError(f"Setting {name} must be a path, got {value!r}")
+        return Path(value)
+    if annotation in (int, float):
+        if isinstance(value, str):
+            try:
+                value = annotation(value)
+            except ValueError:
+                raise ValueError(f"Setting {name} must be a number, got {value!r}") from None
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or (annotation is int and not isinstance(value, int)):
+            raise ValueError(f"Setting {name} must be {annotation.__name__}, got {value!r}")
+        if value < 0:
+            raise ValueError(f"Setting {name} must not be negative, got {value}")
+        return annotation(value)
+    if not isinstance(value, annotation):
+        raise ValueError(f"Setting {name} must be {annotation.__name__}, got {value!r}")
+    return value
+
+
+def _check_names(values: Mapping, source: str):
+    unknown = sorted(set(values) - set(Settings.names()))
+    if unknown:
+        raise ValueError(f"Unknown settings in {source}: {', '.join(unknown)}")
+
+
+@dataclass(frozen=True)
+class Settings(Mapping):
+    """Immutable application settings; also readable as a mapping.
+
+    Every setting is a typed field with its one default. Values are checked
+    and coerced (strings from the environment become ints, bools, paths)
+    when the object is built, including by ``replace``; unknown names and
+    bad values raise ``ValueError``.
+    """
+
+    base_dir: Path = BASE_DIR
+    data_dir: Path = BASE_DIR / "data"
+    abbreviations_path: Optional[Path] = None  # default: <data_dir>/abbreviations.csv
+    synonyms_path: Optional[Path] = None  # default: <data_dir>/synonyms.csv
+
+    # Embeddings
+    embedding_model: str = "all-MiniLM-L6-v2"
+    embedding_backend: Literal["torch", "onnx"] = "torch"
+    onnx_model_dir: Optional[Path] = None
+    onnx_quantized: bool = True
+    onnx_threads: int = 0  # 0: ONNX Runtime's default
+    embedding_cache_size: int = 10000
+    embedding_cache_flush_every: int = 32
+    embedding_cache_disk_size: Optional[int] = None  # None: unbounded
+
+    # Retrieval
+    index_dtype: Literal["float32", "float16"] = "float32"
+    vector_backend: Literal["exact", "ivf"] = "exact"
+    ivf_lists: Optional[int] = None  # None: sqrt(rows)
+    ivf_probe: int = 8
+    dense_fallback: Optional[bool] = None  # None: on for the ivf backend only
+    lexical_threshold: float = 0.9
+    similarity_threshold: float = 0.6
+    rerank_candidates: int = 50
+    fallback_similarity_threshold: Optional[float] = None  # None: similarity_threshold
+    fallback_search_k: int = 10
+
+    # Normalization and safety
+    spell_check: bool = True
+    spell_check_background: bool = True
+    spell_max_edit_distance: int = 2
+    banned_words: Tuple[str, ...] = ()
+    abuse_response: str = "Please keep the conversation respectful."
+    safety_check_pii: bool = False
+    safety_cache_size: int = 10000
+    toxicity_weights_path: Optional[Path] = None
+    toxicity_low_threshold: float = 0.2
+    toxicity_high_threshold: float = 0.9
+    toxicity_model_threshold: float = 0.85
+    toxicity_timeout: float = 2.0
+    toxicity_batch_size: int = 16
+    toxicity_batch_wait: float = 0.01
+
+    # LLM
+    use_openai: bool = False
+    openai_model: str = "gpt-4"
+    llm_base_url: Optional[str] = None
+    llm_api_key: Optional[str] = None  # None: OPENAI_API_KEY
+    llm_timeout: float = 20.0
+    llm_slow_call: float = 10.0
+    llm_max_retries: int = 0
+    llm_max_concurrency: int = 8
+    llm_breaker_failures: int = 5
+    llm_breaker_cooldown: float = 30.0
+    response_cache_threshold: float = 0.95
+    response_cache_ttl: float = 3600.0
+    response_cache_size: int = 1000
+    response_cache_path: Optional[Path] = None  # None: in memory only
+
+    # Engine
+    max_batch_size: int = 32
+    max_batch_wait: float = 0.005
+    preload_models: bool = False
+    hot_reload: bool = False
+    reload_interval: float = 2.0
+    log_conversations: bool = False
+
+    # Conversation memory
+    memory_max_sessions: int = 10000
+    memory_session_ttl: float = 1800.0
+    memory_max_turns: int = 10
+    memory_prompt_tokens: int = 1000
+    memory_spill: bool = False
+    memory_spill_path: Optional[Path] = None  # default: <data_dir>/sessions.sqlite3
+    memory_spill_ttl: float = 7 * 24 * 3600.0
+    memory_shared: Optional[bool] = None  # None: on when server.py runs several workers
+
+    _SECTIONS = ("abbreviations", "synonyms", "qa_data", "device")
+
+    def __post_init__(self):
+        for f in fields(self):
+            object.__setattr__(self, f.name, _coerce(f.name, f.type, getattr(self, f.name)))
+        for name in _FRACTIONS:
+            value = getattr(self, name)
+            if value is not None and not 0 <= value <= 1:
+                raise ValueError(f"Setting {name} must be between 0 and 1, got {value}")
+        for name in _AT_LEAST_ONE:
+            if getattr(self, name) < 1:
+                raise ValueError(f"Setting {name} must be at least 1, got {getattr(self, name)}")
+        object.__setattr__(self, "_files", {
+            "abbreviations": _FileSection(self.abbreviations_path or self.data_dir / "abbreviations.csv",
+                                          _csv_loader({"u": "you", "r": "are"}, "Abbreviations")),
+            "synonyms": _FileSection(self.synonyms_path or self.data_dir / "synonyms.csv",
+                                     _csv_loader({"hod": "head of department"}, "Synonyms")),
+            "qa_data": _FileSection(self.data_dir / "qa_dataset.json", _qa_loader),
+        })
+
+    # --- Lazily loaded sections ---
+
+    @property
+    def data_path(self) -> Path:
+        """Alias of ``data_dir`` used by the engine components"""
+        return self.data_dir
+
+    @property
+    def abbreviations(self) -> Dict[str, str]:
+        return self._files["abbreviations"].get()
+
+    @property
+    def synonyms(self) -> Dict[str, str]:
+        return self._files["synonyms"].get()
+
+    @property
+    def qa_data(self):
+        """The shared ``KnowledgeBase`` for qa_dataset.json"""
+        return self._files["qa_data"].get()
+
+    @cached_property
+    def device(self) -> str:
+        """Probed once; imports torch only on first access"""
+        try:
+            import torch
+        except ImportError:
+            return "cpu"
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    def replace(self, **overrides) -> "Settings":
+        """Validated copy with some settings changed; unknown names raise ``ValueError``"""
+        _check_names(overrides, "replace()")
+        return replace(self, **overrides)
+
+    @classmethod
+    def names(cls) -> List[str]:
+        return [f.name for f in fields(cls)]
+
+    # --- Mapping interface ---
+
+    def _keys(self) -> List[str]:
+        return [*self.names(), "data_path", *self._SECTIONS]
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._keys():
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+
+ENV_PREFIX = "CRESCENT_"
+SETTINGS_FILE_ENV = "CRESCENT_SETTINGS_FILE"
+
+
+def load_settings_file(path: Path) -> Dict[str, Any]:
+    """Setting overrides from a JSON object; unknown names raise ``ValueError``"""
+    with open(path, encoding="utf-8") as f:
+        values = json.load(f)
+    if not isinstance(values, dict):
+        raise ValueError(f"{path} must hold a JSON object of settings")
+    _check_names(values, str(path))
+    return values
+
+
+def settings_from_env(environ: Mapping[str, str]) -> Dict[str, str]:
+    """``CRESCENT_<NAME>`` variables as overrides of ``<name>``; unknown names raise ``ValueError``"""
+    values = {key[len(ENV_PREFIX):].lower(): value for key, value in environ.items()
+              if key.startswith(ENV_PREFIX) and key != SETTINGS_FILE_ENV}
+    _check_names(values, "the environment")
+    return values
+
+
+class ConfigManager:
+    """Builds the settings object once; ``settings`` returns the same instance every time.
+
+    Defaults are overridden by the JSON file named by ``CRESCENT_SETTINGS_FILE``
+    (else ``settings.json`` in the base directory, if present), then by
+    ``CRESCENT_<NAME>`` environment variables, e.g. ``CRESCENT_USE_OPENAI=1``.
+    """
+
+    def __init__(self, base_dir: Path = BASE_DIR):
+        self.base_dir = Path(base_dir)
+        self._settings: Optional[Settings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def settings(self) -> Settings:
+        if self._settings is None:
+            with self._lock:
+                if self._settings is None:
+                    try:
+                        from dotenv import load_dotenv
+                        load_dotenv()
+                    except ImportError:
+                        pass
+                    values: Dict[str, Any] = {"base_dir": self.base_dir, "data_dir": self.base_dir / "data"}
+                    path = os.environ.get(SETTINGS_FILE_ENV) or self.base_dir / "settings.json"
+                    if os.environ.get(SETTINGS_FILE_ENV) or Path(path).exists():
+                        values.update(load_settings_file(Path(path)))
+                    values.update(settings_from_env(os.environ))
+                    settings = Settings(**values)
+                    settings.data_dir.mkdir(exist_ok=True)
+                    self._settings = settings
+        return self._settings
+
 
 config = ConfigManager().settings
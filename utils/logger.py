@@ -1,53 +1,322 @@
+import atexit
+import gzip
 import json
+import os
+import queue
+import shutil
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, Optional
 from .config import config
+from .metrics import metrics
 import uuid
 
-class ChatLogger:
+_STOP = object()
+
+
+class LogWriter(threading.Thread):
+    """Background writer for conversation logs and analytics snapshots.
+
+    Producers enqueue pre-serialized JSON lines and never touch the disk.
+    The thread drains the bounded queue in batches, appends them to the
+    active ``conversations-<pid>.jsonl`` segment, rotates the segment by size
+    or age (gzip-compressing closed segments), and periodically rewrites
+    ``analytics-<pid>.json`` from the registered loggers' counters.
+
+    Files are named per process, so server workers sharing a log directory
+    never rotate a segment another process still has open. Segments left
+    behind by processes that have exited are rotated when a writer starts.
+    """
+
+    def __init__(self, log_dir: Path, max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 1.0, max_segment_bytes: int = 10 * 1024 * 1024,
+                 max_segment_age: float = 24 * 3600, compress: bool = True,
+                 analytics_interval: float = 30.0):
+        super().__init__(name="chat-log-writer", daemon=True)
+        self.log_dir = Path(log_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.compress = compress
+        self.analytics_interval = analytics_interval
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._loggers: "weakref.WeakSet[ChatLogger]" = weakref.WeakSet()
+        self._segment = None
+        self._segment_opened = 0.0
+        self._last_analytics = time.monotonic()
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self.pid = os.getpid()
+        self.segment_path = self.log_dir / f"conversations-{self.pid}.jsonl"
+        self.analytics_path = self.log_dir / f"analytics-{self.pid}.json"
+
+    def register(self, logger: "ChatLogger"):
+        self._loggers.add(logger)
+
+    def submit(self, line: str) -> bool:
+        """Enqueue one log line without blocking; returns False if the queue is full"""
+        # Count the line before the writer can see it, so _pending never goes negative
+        with self._flushed:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            with self._flushed:
+                self._pending -= 1
+                self._flushed.notify_all()
+            self.dropped += 1
+            metrics.counter("chat_log_dropped_total").inc()
+            return False
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is on disk"""
+        try:
+            self._queue.put_nowait(None)  # wake the writer without waiting for flush_interval
+        except queue.Full:
+            pass  # a full queue keeps the writer busy anyway
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Drain the queue, write final analytics and stop the thread"""
+        if self.is_alive():
+            self._queue.put(_STOP)
+            self.join(timeout)
+
+    # --- Writer thread ---
+
+    def run(self):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._rotate_orphans()
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            batch = []
+            while True:
+                if item is _STOP:
+                    running = False
+                elif item is not None:
+                    batch.append(item)
+                if not running or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            if not running or time.monotonic() - self._last_analytics >= self.analytics_interval:
+                self._write_analytics()
+        self._close_segment()
+
+    def _write(self, lines):
+        try:
+            self._maybe_rotate()
+            if self._segment is None:
+                self._segment = open(self.segment_path, "a", encoding="utf-8")
+                self._segment_opened = time.time()
+            self._segment.write("\n".join(lines) + "\n")
+            self._segment.flush()
+        except OSError as e:
+            print(f"Conversation log write failed: {e}")
+        finally:
+            with self._flushed:
+                self._pending -= len(lines)
+                self._flushed.notify_all()
+
+    def _maybe_rotate(self):
+        if not self.segment_path.exists():
+            return
+        # A segment this writer didn't open was left by an earlier process with
+        # the same pid; its age is unknown, so it is closed off before appending
+        inherited = self._segment is None
+        too_big = self.segment_path.stat().st_size >= self.max_segment_bytes
+        too_old = not inherited and time.time() - self._segment_opened >= self.max_segment_age
+        if inherited or too_big or too_old:
+            self._close_segment()
+            self._rotate(self.segment_path, self.pid)
+
+    def _rotate_orphans(self):
+        """Rotate active segments of processes that are no longer running"""
+        for path in self.log_dir.glob("conversations-*.jsonl"):
+            pid = path.stem.split("-", 1)[1]
+            if pid.isdigit() and int(pid) != self.pid and not _process_alive(int(pid)):
+                try:
+                    self._rotate(path, int(pid))
+                except OSError as e:
+                    print(f"Conversation log rotation failed: {e}")
+
+    def _rotate(self, path: Path, pid: int):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        rotated = self.log_dir / f"conversations-{pid}-{stamp}.jsonl"
+        os.replace(path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _write_analytics(self):
+        self._last_analytics = time.monotonic()
+        snapshot = {
+            "updated": datetime.now().isoformat(),
+            "dropped_log_entries": self.dropped,
+            "sessions": {session_id: stats for logger in list(self._loggers)
+                         for session_id, stats in logger.session_analytics().items()},
+        }
+        tmp = self.analytics_path.with_suffix(".tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.analytics_path)
+        except OSError as e:
+            print(f"Analytics write failed: {e}")
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":  # os.kill would terminate it; leave the segment alone
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, owned by someone else
+    return True
+
+
+_writers: Dict[Path, LogWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(log_dir: Path, **options) -> LogWriter:
+    """Process-wide writer per log directory, started on first use and flushed at exit.
+
+    A forked child gets a writer of its own: the parent's thread didn't survive the fork.
+    """
+    log_dir = Path(log_dir).resolve()
+    with _writers_lock:
+        writer = _writers.get(log_dir)
+        if writer is None or not writer.is_alive():
+            writer = LogWriter(log_dir, **options)
+            writer.start()
+            atexit.register(writer.close)
+            _writers[log_dir] = writer
+    return writer
+
+
+class _SessionStats:
+    """Analytics counters of one conversation"""
+
     def __init__(self):
-        self.session_id = str(uuid.uuid4())
-        self.analytics = {
-            "session_start": datetime.now().isoformat(),
-            "queries": 0,
-            "average_response_time": 0,
-            "fallbacks_used": 0,
-            "unanswered_questions": []
+        self.session_start = datetime.now().isoformat()
+        self.queries = 0
+        self.total_response_time = 0.0
+        self.fallbacks_used = 0
+        self.unanswered_count = 0
+        self.unanswered_questions = deque(maxlen=100)  # most recent only
+
+    def update(self, user_input: str, response: str, response_time: float):
+        self.queries += 1
+        self.total_response_time += response_time
+
+        if "I don't know" in response:
+            self.unanswered_count += 1
+            self.unanswered_questions.append(user_input)
+
+        if "fallback" in response.lower():
+            self.fallbacks_used += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_start": self.session_start,
+            "queries": self.queries,
+            "average_response_time": self.total_response_time / self.queries if self.queries else 0,
+            "fallbacks_used": self.fallbacks_used,
+            "unanswered_count": self.unanswered_count,
+            "unanswered_questions": list(self.unanswered_questions),
         }
 
-    def log_conversation(self, user_input: str, response: str):
-        """Log complete conversation"""
+
+class ChatLogger:
+    """Conversation log and per-session analytics for one process.
+
+    Callers pass each exchange's conversation ``session_id``; exchanges
+    without one go to this logger's own id. Analytics are kept for the
+    ``max_sessions`` most recently active sessions.
+    """
+
+    def __init__(self, log_dir: Optional[Path] = None, max_sessions: int = 10000, **writer_options):
+        self.session_id = str(uuid.uuid4())
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionStats]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self._log_dir = log_dir or Path(config["data_dir"]) / "logs"
+        self._writer_options = writer_options
+        self._writer = get_writer(self._log_dir, **writer_options)
+        self._writer.register(self)
+
+    @property
+    def writer(self) -> LogWriter:
+        """This process's writer; a logger created before a fork switches to the child's own"""
+        if self._writer.pid != os.getpid():
+            self._writer = get_writer(self._log_dir, **self._writer_options)
+            self._writer.register(self)
+        return self._writer
+
+    def log_conversation(self, user_input: str, response: str, response_time: float,
+                         session_id: Optional[str] = None):
+        """Log complete conversation (queued; written by the background writer); ``response_time`` is this request's latency in seconds"""
+        session_id = session_id or self.session_id
         entry = {
             "timestamp": datetime.now().isoformat(),
-            "session_id": self.session_id,
+            "session_id": session_id,
             "user_input": user_input,
             "response": response,
-            "response_time": self._get_last_response_time()
+            "response_time": response_time
         }
-        
-        # Append to conversation log
-        with open(config.CONVERSATION_LOG, "a") as f:
-            f.write(json.dumps(entry) + "\n")
-        
+        self.writer.submit(json.dumps(entry))
+
         # Update analytics
-        self._update_analytics(user_input, response)
+        with self._sessions_lock:
+            stats = self._sessions.get(session_id)
+            if stats is None:
+                stats = self._sessions[session_id] = _SessionStats()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            stats.update(user_input, response, response_time)
 
-    def _update_analytics(self, user_input: str, response: str):
-        self.analytics["queries"] += 1
-        
-        if "I don't know" in response:
-            self.analytics["unanswered_questions"].append(user_input)
-        
-        if "fallback" in response.lower():
-            self.analytics["fallbacks_used"] += 1
-        
-        # Save analytics snapshot
-        with open(config.ANALYTICS_LOG, "w") as f:
-            json.dump(self.analytics, f)
-
-    def _get_last_response_time(self) -> float:
-        # Implement actual timing logic
-        return 0.0
-
-    def get_analytics(self):
-        return self.analytics
+    def get_analytics(self, session_id: Optional[str] = None) -> Dict:
+        """Counters of one session (default: this logger's own)"""
+        with self._sessions_lock:
+            stats = self._sessions.get(session_id or self.session_id)
+            return (stats or _SessionStats()).to_dict()
+
+    def session_analytics(self) -> Dict[str, Dict]:
+        """Counters of every tracked session, by session id"""
+        with self._sessions_lock:
+            return {session_id: stats.to_dict() for session_id, stats in self._sessions.items()}
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until this process's queued log lines are written"""
+        return self.writer.flush(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Drain the log and write a final analytics snapshot; for processes that skip atexit"""
+        self.writer.close(timeout)
@@ -0,0 +1,218 @@
+"""In-process metrics: counters and latency histograms for the chat pipeline.
+
+Usage::
+
+    with metrics.timer("chat_stage_seconds", stage="normalize"):
+        ...
+    metrics.counter("chat_answers_total", stage="exact").inc()
+    print(metrics.to_prometheus())
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+# Latency buckets in seconds: 50us .. 30s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+T = TypeVar("T")
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated within buckets"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "last", "_lock")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.last = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            self.last = value
+
+    def snapshot(self) -> "Histogram":
+        """Consistent copy, for export while other threads keep observing"""
+        copy = Histogram(self.buckets)
+        with self._lock:
+            copy.counts, copy.sum, copy.count, copy.last = list(self.counts), self.sum, self.count, self.last
+        return copy
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters: Dict[str, Dict[LabelKey, Counter]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, family: dict, name: str, labels: Dict[str, str], factory):
+        key = tuple(sorted(labels.items()))
+        metric = family.get(name, {}).get(key)
+        if metric is None:
+            with self._lock:
+                metric = family.setdefault(name, {}).setdefault(key, factory())
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(self._counters, name, labels, Counter)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(self._histograms, name, labels, Histogram)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the wall time of the ``with`` block, in seconds"""
+        histogram = self.histogram(name, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def timed(self, name: str, **labels):
+        """Decorator form of ``timer``; the histogram is looked up per call, so it survives ``reset``"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.histogram(name, **labels).observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, items: Iterable[T], name: str, **labels) -> Iterator[T]:
+        """Yield from ``items``, observing the time spent producing them but not the consumer's time between them"""
+        histogram = self.histogram(name, **labels)
+        busy, resumed = 0.0, time.perf_counter()
+        try:
+            for item in items:
+                busy += time.perf_counter() - resumed
+                resumed = None
+                yield item
+                resumed = time.perf_counter()
+        finally:
+            if resumed is not None:
+                busy += time.perf_counter() - resumed
+            histogram.observe(busy)
+
+    def last(self, name: str, **labels) -> Optional[float]:
+        """Most recent observation of a histogram, or None if never observed"""
+        histogram = self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+        return histogram.last if histogram and histogram.count else None
+
+    def reset(self):
+        """Drop every series; code must not hold on to a metric object across this"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _snapshot(self) -> Tuple[Dict[str, Dict[LabelKey, float]], Dict[str, Dict[LabelKey, Histogram]]]:
+        """Counter values and histogram copies, taken under the lock new series are added with"""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+        return ({name: {key: c.value for key, c in series.items()} for name, series in counters.items()},
+                {name: {key: h.snapshot() for key, h in series.items()} for name, series in histograms.items()})
+
+    # --- Export ---
+
+    @staticmethod
+    def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        counters, histograms = self._snapshot()
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{self._format_labels(key)} {value:g}")
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in series.items():
+                cumulative = 0
+                for bound, count in zip(hist.buckets + (float("inf"),), hist.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{self._format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(key)} {hist.sum:g}")
+                lines.append(f"{name}_count{self._format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        """Counters plus count/mean/p50/p95/p99 per histogram series"""
+        def label_str(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key) or "_"
+
+        counters, histograms = self._snapshot()
+        return {
+            "counters": {
+                name: {label_str(key): value for key, value in series.items()}
+                for name, series in counters.items()
+            },
+            "histograms": {
+                name: {
+                    label_str(key): {
+                        "count": h.count,
+                        "mean": h.sum / h.count if h.count else 0.0,
+                        "p50": h.quantile(0.50),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for key, h in series.items()
+                }
+                for name, series in histograms.items()
+            },
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+
+metrics = MetricsRegistry()
@@ -1,54 +1,270 @@
-from transformers import pipeline
-from .config import config
-from typing import Tuple
+from .metrics import metrics
+from .text_match import trie_pattern
+from models import registry
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from typing import Dict, List, Optional, Tuple
+import json
+import math
+import queue
 import re
+import threading
+import time
+
+TOXICITY_MODEL = "unitary/toxic-bert"
+
+_PII_PATTERN = r"\b\d{10}\b|\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"
+_TOKEN_RE = re.compile(r"[a-z']+")
+
+# Hand-picked seed weights, not trained on anything: they only decide when toxic-bert
+# times out. Trained weights from config["toxicity_weights_path"] (JSON {"bias":
+# float, "weights": {token_or_bigram: float}}) also let the linear tier decide alone.
+_SEED_WEIGHTS = {
+    "bias": -4.0,
+    "weights": {
+        "idiot": 3.5, "stupid": 3.0, "dumb": 2.5, "fool": 2.0, "useless": 2.0,
+        "hate": 2.0, "shut": 1.5, "shut up": 2.5, "kill": 3.0, "die": 2.0,
+        "ugly": 2.0, "trash": 2.0, "rubbish": 1.5, "nonsense": 1.5, "moron": 3.5,
+        "loser": 2.5, "pathetic": 2.5, "disgusting": 2.5, "damn": 1.5, "hell": 1.0,
+        "suck": 2.0, "sucks": 2.0, "screw": 1.5, "threat": 1.0, "attack": 1.0,
+        "please": -1.0, "thanks": -1.5, "thank": -1.5, "how": -0.5, "what": -0.5,
+    },
+}
+
+
+class LinearToxicityScorer:
+    """Logistic model over unigrams and bigrams; microseconds per message"""
+
+    def __init__(self, weights: Dict, trained: bool = True):
+        self.trained = trained
+        self.bias = float(weights.get("bias", 0.0))
+        self.weights = {k.lower(): float(v) for k, v in weights.get("weights", {}).items()}
+
+    @classmethod
+    def from_config(cls, settings) -> "LinearToxicityScorer":
+        path = settings["toxicity_weights_path"]
+        if path:
+            try:
+                with open(path) as f:
+                    return cls(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Toxicity weights load failed, using seed weights: {e}")
+        return cls(_SEED_WEIGHTS, trained=False)
+
+    def score(self, text: str) -> float:
+        tokens = _TOKEN_RE.findall(text.lower())
+        z = self.bias
+        weights = self.weights
+        for i, token in enumerate(tokens):
+            z += weights.get(token, 0.0)
+            if i:
+                z += weights.get(f"{tokens[i - 1]} {token}", 0.0)
+        return 1.0 / (1.0 + math.exp(-z))
+
+
+class _ClassifierBatcher:
+    """Coalesces concurrent transformer calls from many threads into one batched call"""
+
+    def __init__(self, classify, max_batch_size: int = 16, max_wait: float = 0.01):
+        self.classify = classify
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit_many(self, texts: List[str]) -> List[Future]:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="toxicity-batcher", daemon=True)
+                self._thread.start()
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return futures
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch_size:
+                    batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            try:
+                results = self.classify([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
 
 class SafetyChecker:
-    def __init__(self):
-        # Initialize hate speech classifier
-        self.toxicity_classifier = pipeline(
-            "text-classification",
-            model="unitary/toxic-bert",
-            device="cpu"
-        )
-        
-        # Compile regex patterns
-        self.banned_pattern = re.compile(
-            r'\b(' + '|'.join(map(re.escape, config.BANNED_WORDS)) + r')\b', 
-            flags=re.IGNORECASE
-        )
-        self.pii_pattern = re.compile(
-            r'\b\d{10}\b|\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+    """Tiered safety engine; each tier only runs when the cheaper ones are inconclusive.
+
+    1. One pass of a compiled automaton over banned words and PII patterns
+       (PII only with ``check_pii``).
+    2. A linear toxicity scorer: below ``low`` is safe, above ``high`` is toxic.
+       Only with trained weights; with the seed weights every message that
+       passes tier 1 is borderline.
+    3. toxic-bert, only for borderline messages, batched across concurrent callers.
+       A verdict not back within ``toxicity_timeout`` seconds (e.g. while the
+       model is still loading) falls back to the linear score.
+
+    Verdicts are cached per normalized message.
+    """
+
+    def __init__(self, settings=None, check_pii: bool = True):
+        if settings is None:
+            from .config import config as settings  # app-wide settings; heavy import, so deferred
+        self.abuse_response = settings["abuse_response"]
+        self.low_threshold = settings["toxicity_low_threshold"]
+        self.high_threshold = settings["toxicity_high_threshold"]
+        self.model_threshold = settings["toxicity_model_threshold"]
+        self.model_timeout = settings["toxicity_timeout"]
+
+        # Compile regex patterns: banned words and PII as named groups of one automaton
+        banned = trie_pattern(w.lower() for w in settings["banned_words"])
+        alternatives = [f"(?P<pii>{_PII_PATTERN})"] if check_pii else []
+        if banned:
+            alternatives.insert(0, rf"(?P<banned>\b{banned}\b)")
+        self.pattern = re.compile("|".join(alternatives), flags=re.IGNORECASE) if alternatives else None
+
+        self.scorer = LinearToxicityScorer.from_config(settings)
+        self._batcher = _ClassifierBatcher(
+            self._classify,
+            max_batch_size=settings["toxicity_batch_size"],
+            max_wait=settings["toxicity_batch_wait"],
         )
+        self._cache: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
+        self._cache_size = settings["safety_cache_size"]
+        self._cache_lock = threading.Lock()
+        self._classifier = None
+        self._classifier_failed = False
+
+    @property
+    def toxicity_classifier(self):
+        """Hate speech classifier, loaded on first borderline message; None if it can't be loaded"""
+        if self._classifier is None and not self._classifier_failed:
+            try:
+                self._classifier = registry.hf_pipeline("text-classification", TOXICITY_MODEL, device="cpu")
+            except Exception as e:
+                self._classifier_failed = True  # don't retry the load or download on every message
+                print(f"Couldn't load toxicity classifier: {e}")
+        return self._classifier
+
+    def warm_up(self):
+        """Load the classifier in the background"""
+        return registry.warm_up(lambda: self.toxicity_classifier)
+
+    def _classify(self, texts: List[str]) -> List[dict]:
+        classifier = self.toxicity_classifier
+        if classifier is None:
+            raise RuntimeError("toxicity classifier unavailable")
+        with metrics.timer("safety_tier_seconds", tier="transformer"):
+            return classifier([text[:512] for text in texts])
 
     def check_input(self, text: str) -> Tuple[bool, str]:
         """Comprehensive safety check"""
-        # Check for banned words
-        if self.banned_pattern.search(text):
-            return False, "banned_words"
-        
-        # Check for PII
-        if self.pii_pattern.search(text):
-            return False, "pii_detected"
-        
-        # Check toxicity
-        result = self.toxicity_classifier(text[:512])[0]
-        if result["label"] == "toxic" and result["score"] > 0.85:
+        return self.check_inputs([text])[0]
+
+    def check_inputs(self, texts: List[str]) -> List[Tuple[bool, str]]:
+        """Check several messages; borderline ones share one transformer batch"""
+        verdicts: List[Optional[Tuple[bool, str]]] = [None] * len(texts)
+        borderline = []
+        for i, text in enumerate(texts):
+            key = " ".join(text.lower().split())
+            cached = self._cache_get(key)
+            if cached is not None:
+                metrics.counter("safety_verdicts_total", tier="cache").inc()
+                verdicts[i] = cached
+                continue
+            verdict = self._cheap_verdict(text)
+            if verdict is None:
+                borderline.append((i, key, text))
+            else:
+                verdicts[i] = verdict
+                self._cache_put(key, verdict)
+
+        if borderline and self._classifier_failed:
+            # No classifier in this process: the cheap tiers already passed these
+            for i, key, _ in borderline:
+                verdicts[i] = (True, "")
+                self._cache_put(key, verdicts[i])
+            borderline = []
+        if borderline:
+            futures = self._batcher.submit_many([text for _, _, text in borderline])
+            deadline = time.monotonic() + self.model_timeout  # one wait for the whole batch
+            for (i, key, _), future in zip(borderline, futures):
+                try:
+                    result = future.result(timeout=max(deadline - time.monotonic(), 0))
+                    toxic = result["label"] == "toxic" and result["score"] > self.model_threshold
+                    verdict = (False, "toxic_content") if toxic else (True, "")
+                except TimeoutError:
+                    # Classifier too slow (or still loading): decide on the linear score,
+                    # uncached, so the message gets the model's verdict next time
+                    metrics.counter("safety_verdicts_total", tier="linear").inc()
+                    toxic = self.scorer.score(texts[i]) > self.model_threshold
+                    verdicts[i] = (False, "toxic_content") if toxic else (True, "")
+                    continue
+                except Exception as e:
+                    # Classifier unavailable: the cheap tiers already passed it
+                    verdicts[i] = (True, "")
+                    if self._classifier_failed:
+                        self._cache_put(key, verdicts[i])  # no retry coming; the load failure was reported
+                    else:
+                        print(f"Toxicity classifier failed: {e}")
+                    continue
+                metrics.counter("safety_verdicts_total", tier="transformer").inc()
+                verdicts[i] = verdict
+                self._cache_put(key, verdict)
+        return verdicts
+
+    def _cheap_verdict(self, text: str) -> Optional[Tuple[bool, str]]:
+        """Tiers 1-2; None means borderline"""
+        with metrics.timer("safety_tier_seconds", tier="automaton"):
+            match = self.pattern.search(text) if self.pattern else None
+        if match:
+            metrics.counter("safety_verdicts_total", tier="automaton").inc()
+            return False, "banned_words" if match.lastgroup == "banned" else "pii_detected"
+        if not self.scorer.trained:
+            return None
+
+        with metrics.timer("safety_tier_seconds", tier="linear"):
+            score = self.scorer.score(text)
+        if score < self.low_threshold:
+            metrics.counter("safety_verdicts_total", tier="linear").inc()
+            return True, ""
+        if score > self.high_threshold:
+            metrics.counter("safety_verdicts_total", tier="linear").inc()
             return False, "toxic_content"
-        
-        return True, ""
+        return None
+
+    def _cache_get(self, key: str) -> Optional[Tuple[bool, str]]:
+        with self._cache_lock:
+            verdict = self._cache.get(key)
+            if verdict is not None:
+                self._cache.move_to_end(key)
+            return verdict
+
+    def _cache_put(self, key: str, verdict: Tuple[bool, str]):
+        with self._cache_lock:
+            self._cache[key] = verdict
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
 
     def get_safety_response(self, violation_type: str) -> str:
         """Appropriate responses for different violations"""
         responses = {
-            "banned_words": config.ABUSE_RESPONSE,
-            "pii_detected": """
-            For your privacy, please don't share personal information.
-            Ask your question without including emails, phone numbers, etc.
-            """,
-            "toxic_content": """
-            I aim to maintain respectful conversations. 
-            Could you please rephrase your question more politely?
-            """
+            "banned_words": self.abuse_response,
+            "pii_detected": ("For your privacy, please don't share personal information. "
+                             "Ask your question without including emails, phone numbers, etc."),
+            "toxic_content": ("I aim to maintain respectful conversations. "
+                              "Could you please rephrase your question more politely?"),
         }
-        return responses.get(violation_type, config.ABUSE_RESPONSE)
+        return responses.get(violation_type, self.abuse_response)
@@ -0,0 +1,40 @@
+"""Multi-pattern matching compiled into a single regex automaton.
+
+A plain ``a|b|c`` alternation makes the regex engine retry every word at
+every position. Factoring the words into a character trie first
+(``ab(?:c|d)`` instead of ``abc|abd``) means each position costs one walk
+down the trie, the same work an Aho-Corasick automaton does, but inside the
+C regex engine.
+"""
+import re
+from typing import Dict, Iterable
+
+_END = ""
+
+
+def _build_trie(words: Iterable[str]) -> Dict:
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_END] = {}
+    return trie
+
+
+def _trie_regex(node: Dict) -> str:
+    ends_here = _END in node
+    branches = [re.escape(char) + _trie_regex(child)
+                for char, child in sorted(node.items()) if char != _END]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if ends_here:
+        return f"(?:{body})?"
+    return body
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """Regex source matching any of ``words``; empty words are ignored"""
+    words = [w for w in words if w]
+    return _trie_regex(_build_trie(words)) if words else ""